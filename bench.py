@@ -0,0 +1,277 @@
+# coding=utf-8
+import argparse
+from collections import Counter
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import datasource
+import htmlparser
+
+
+def get_corpus():
+    """
+    Zwraca kody stron zapisanych w magazynie stron.
+
+    :returns: generator par (adres, html)
+    """
+    for url in datasource.page_store.iter_urls():
+        yield url, datasource.page_store.read(url)
+
+
+def break_on_upper_reference(text):
+    """
+    Pierwotna implementacja break_on_upper, znak po znaku.
+
+    :param text: tekst
+    :returns: poprawiony tekst
+    """
+    return "".join([htmlparser.space_before_upper(c, htmlparser.char_before(text, i))
+                    for i, c in enumerate(text)])
+
+
+def break_on_upper(args):
+    """
+    Sprawdza zgodność break_on_upper z implementacją znak po znaku na zapisanych stronach i porównuje czas.
+
+    :param args: argumenty z linii komend
+    """
+    texts = [(name, htmlparser.get_raw_text_from_html(html)) for name, html in get_corpus()]
+    htmlparser.get_upper_break_pattern()
+
+    start = time.time()
+    expected = [break_on_upper_reference(text) for name, text in texts]
+    reference_time = time.time() - start
+    start = time.time()
+    actual = [htmlparser.break_on_upper(text) for name, text in texts]
+    new_time = time.time() - start
+
+    different = [name for (name, text), e, a in zip(texts, expected, actual) if e != a]
+    for name in different:
+        print "DIFFERENT:", name
+    print "Pages: {}, different: {}".format(len(texts), len(different))
+    print "Reference: {:.3f}s, regex: {:.3f}s".format(reference_time, new_time)
+
+
+def tokenize_reference(text):
+    """
+    Pierwotna tokenizacja: nltk.word_tokenize, a potem usunięcie znaków niealfanumerycznych i małe litery.
+
+    :param text: tekst
+    :returns: lista tokenów
+    """
+    import nltk
+    return [htmlparser.filter_nonalnum(t).lower() for t in nltk.word_tokenize(text)]
+
+
+def filter_text_reference(text, stemming=True):
+    """
+    Pierwotna implementacja filter_text, z tokenizacją nltk.
+
+    :param text: tekst
+    :param stemming: flaga czy stemować
+    :returns: przefiltrowane tokeny
+    """
+    stopwords = htmlparser.get_stopwords()
+    tokens = tokenize_reference(text)
+    if stemming:
+        tokens = htmlparser.stem(tokens)
+    tokens = [word for word in tokens if word not in stopwords]
+    return filter(htmlparser.filter_short, tokens)
+
+
+def filter_tokens_reference(text, stemming=True):
+    """
+    Filtracja w osobnych przebiegach: tokenizacja, stemming, powszechne słowa, krótkie słowa.
+
+    :param text: tekst
+    :param stemming: flaga czy stemować
+    :returns: przefiltrowane tokeny
+    """
+    stopwords = htmlparser.get_stopwords()
+    tokens = htmlparser.tokenize(text)
+    if stemming:
+        tokens = htmlparser.stem(tokens)
+    tokens = [word for word in tokens if word not in stopwords]
+    return filter(htmlparser.filter_short, tokens)
+
+
+def filter_text(args):
+    """
+    Sprawdza zgodność jednoprzebiegowego filter_text z filtracją w osobnych przebiegach na zapisanych stronach
+    i porównuje czas (z wyłączoną pamięcią stemów).
+
+    :param args: argumenty z linii komend
+    """
+    texts = [(name, htmlparser.get_text_from_html(html)) for name, html in get_corpus()]
+    htmlparser.get_stemmed_stopwords()
+    memo_size = htmlparser.stemmer.memo_size
+    htmlparser.stemmer.memo_size = 0
+    try:
+        for stemming in (True, False):
+            start = time.time()
+            expected = [filter_tokens_reference(text, stemming) for name, text in texts]
+            reference_time = time.time() - start
+            start = time.time()
+            actual = [htmlparser.filter_text(text, stemming) for name, text in texts]
+            new_time = time.time() - start
+            different = [name for (name, text), e, a in zip(texts, expected, actual) if e != a]
+            for name in different:
+                print "DIFFERENT:", name
+            print "Stemming: {}, pages: {}, different: {}, separate passes: {:.3f}s, fused: {:.3f}s".format(
+                stemming, len(texts), len(different), reference_time, new_time)
+    finally:
+        htmlparser.stemmer.memo_size = memo_size
+
+
+def tokenize(args):
+    """
+    Sprawdza zgodność wyniku filter_text z tokenizacją nltk i bez niej na zapisanych stronach
+    i porównuje przepustowość samej tokenizacji.
+
+    :param args: argumenty z linii komend
+    """
+    texts = [(name, htmlparser.get_text_from_html(html)) for name, html in get_corpus()]
+    size = sum(len(text) for name, text in texts) / 1024.0 / 1024.0
+
+    start = time.time()
+    for name, text in texts:
+        tokenize_reference(text)
+    reference_time = time.time() - start
+    start = time.time()
+    for name, text in texts:
+        htmlparser.tokenize(text)
+    new_time = time.time() - start
+
+    same_pages = 0
+    common = 0
+    total = 0
+    missing = Counter()
+    extra = Counter()
+    for name, text in texts:
+        expected = Counter(filter_text_reference(text))
+        actual = Counter(htmlparser.filter_text(text))
+        if expected == actual:
+            same_pages += 1
+        common += sum((expected & actual).values())
+        total += max(sum(expected.values()), sum(actual.values()))
+        missing.update(expected - actual)
+        extra.update(actual - expected)
+
+    print "Pages: {}, identical token counts: {}".format(len(texts), same_pages)
+    print "Token agreement: {:.4%} ({} of {})".format(float(common) / total if total else 1.0, common, total)
+    for label, counter in (("Only nltk", missing), ("Only regex", extra)):
+        if counter:
+            print "{}: {}".format(label, ", ".join(u"{} x{}".format(t, n) for t, n in counter.most_common(args.top)))
+    print "nltk: {:.3f}s ({:.2f} MB/s), regex: {:.3f}s ({:.2f} MB/s)".format(
+        reference_time, size / reference_time if reference_time else 0, new_time, size / new_time if new_time else 0)
+
+
+def startup(args):
+    """
+    Mierzy czas działania `python cli.py classify <url>` dla strony, której model i tekst są już na dysku,
+    oraz dla porównania `python cli.py --help`.
+
+    :param args: argumenty z linii komend
+    """
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    commands = [('--help', [sys.executable, cli, '--help']),
+                ('classify', [sys.executable, cli, 'classify', args.url, '-f', args.f])]
+    with open(os.devnull, 'w') as devnull:
+        # pierwsze uruchomienie tworzy model i zapisuje tekst strony w pamięci podręcznej
+        subprocess.check_call(commands[1][1], stdout=devnull)
+        for name, command in commands:
+            times = []
+            for i in xrange(args.repeat):
+                start = time.time()
+                subprocess.check_call(command, stdout=devnull)
+                times.append(time.time() - start)
+            times.sort()
+            print "{}: min {:.3f}s, median {:.3f}s".format(name, times[0], times[len(times) // 2])
+
+
+def measure_predictions(predict, texts, threads):
+    """
+    Wykonuje przewidywania dla wszystkich tekstów z kilku wątków naraz.
+
+    :param predict: funkcja przewidująca kategorię jednego tekstu
+    :param texts: lista przefiltrowanych tekstów
+    :param threads: liczba wątków
+    :returns: łączny czas, mediana czasu jednego przewidywania
+    """
+    latencies = []
+
+    def work(part):
+        for text in part:
+            start = time.time()
+            predict(text)
+            latencies.append(time.time() - start)
+
+    workers = [threading.Thread(target=work, args=(texts[i::threads],)) for i in xrange(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    total = time.time() - start
+    latencies.sort()
+    return total, latencies[len(latencies) // 2]
+
+
+def batching(args):
+    """
+    Porównuje przewidywania pojedynczych tekstów z przewidywaniami łączonymi w partie przez BatchingPredictor
+    przy różnej liczbie równoległych wątków.
+
+    :param args: argumenty z linii komend
+    """
+    import main
+    import serving
+    model = main.get_inference_model(args.f)
+    texts = [htmlparser.get_filtered_text(url) for url in datasource.page_store.iter_urls()]
+    texts = (texts * (args.requests // max(1, len(texts)) + 1))[:args.requests]
+    predictor = serving.BatchingPredictor(args.max_wait, args.max_batch)
+    for threads in args.threads:
+        for name, predict in (('single', lambda text: model.predict_texts([text])),
+                              ('batched', lambda text: predictor.predict(model, text))):
+            total, p50 = measure_predictions(predict, texts, threads)
+            print "{:<8} threads: {:<3} {:8.1f} req/s, p50 {:.2f}ms".format(name, threads, len(texts) / total,
+                                                                           p50 * 1000)
+
+
+def get_parser():
+    """
+    Tworzy parser parametrów z linii komend.
+
+    :return: obiekt parsera
+    """
+    parser = argparse.ArgumentParser(description='Website classificator benchmarks')
+    subparsers = parser.add_subparsers(help='benchmarks')
+    break_parser = subparsers.add_parser('break-on-upper')
+    break_parser.set_defaults(func=break_on_upper)
+    filter_parser = subparsers.add_parser('filter-text')
+    filter_parser.set_defaults(func=filter_text)
+    tokenize_parser = subparsers.add_parser('tokenize')
+    tokenize_parser.add_argument('--top', type=int, default=20)
+    tokenize_parser.set_defaults(func=tokenize)
+    startup_parser = subparsers.add_parser('startup')
+    startup_parser.add_argument('url')
+    startup_parser.add_argument('-f', default="websites.txt")
+    startup_parser.add_argument('-n', '--repeat', type=int, default=5)
+    startup_parser.set_defaults(func=startup)
+    batching_parser = subparsers.add_parser('batching')
+    batching_parser.add_argument('-f', default="websites.txt")
+    batching_parser.add_argument('-n', '--requests', type=int, default=2000)
+    batching_parser.add_argument('-t', '--threads', type=int, nargs='+', default=[1, 8, 32])
+    batching_parser.add_argument('--max-wait', type=float, default=0.005)
+    batching_parser.add_argument('--max-batch', type=int, default=32)
+    batching_parser.set_defaults(func=batching)
+    return parser
+
+
+if __name__ == '__main__':
+    parser = get_parser()
+    args = parser.parse_args()
+    args.func(args)
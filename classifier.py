@@ -1,17 +1,24 @@
 # coding=utf-8
+import abc
 from collections import defaultdict
+import copy
 import random
+import numpy as np
 import scipy
 from sklearn import cross_validation
-from sklearn.feature_extraction import DictVectorizer
-from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.base import BaseEstimator, TransformerMixin, clone
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfTransformer, TfidfVectorizer
 from sklearn.linear_model import SGDClassifier
 from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
 from sklearn.svm import SVC, LinearSVC
 import datasource
-from htmlparser import get_filtered_text, get_link_text_length
+from featurecache import FeatureCache
+from htmlparser import TokenAnalyzer, get_filtered_texts, get_filtered_tokens, get_link_text_length
 import htmlparser
 
+feature_cache = FeatureCache()
+
 
 def dict_by_category(entries):
     """
@@ -49,15 +56,16 @@ def get_train_eval_sets(entries, partition):
     return test_set, eval_set
 
 
-def get_trained_classifier(entries):
+def get_trained_classifier(entries, processes=1):
     """
     Zwraca wytrenowany klasyfikator.
 
     :param entries: lista słowników zawierających url i kategorię strony
+    :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
     :returns: wytrenowany klasyfikator
     """
     clf = get_classifier()
-    clf.train(entries)
+    clf.train(entries, processes)
     return clf
 
 
@@ -71,35 +79,127 @@ def get_classifier():
     return CategoryClassifier(SGDClassifier())
 
 
-def get_texts_categories(entry_dict):
+def get_streaming_classifier():
+    """
+    Zwraca obiekt klasyfikatora uczonego strumieniowo.
+
+    :rtype : StreamingCategoryClassifier
+    :returns: klasyfikator
+    """
+    return StreamingCategoryClassifier(SGDClassifier())
+
+
+def get_texts_categories(entry_dict, processes=1):
     """
     Zwraca słownik z listą przefiltrowanych tekstów stron i ich kategorii.
 
     :param entry_dict: słownik url: kategoria
+    :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
     :returns: słownik zawierający listę tekstów i kategorii
     """
-    texts = []
-    categories = []
-    for key in entry_dict:
-        text = get_filtered_text(key)
-        texts.append(text)
-        categories.append(entry_dict[key])
+    urls = list(entry_dict)
+    texts = get_filtered_texts(urls, processes=processes)
+    categories = [entry_dict[url] for url in urls]
 
     return {"texts": texts, "categories": categories}
 
 
-def get_texts_categories_url(entry_dict):
+def get_texts_categories_url(entry_dict, processes=1):
     """
     Zwraca słownik url: text, kategoria
 
-    :param entry_dict:
+    :param entry_dict: słownik url: kategoria
+    :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
     :returns: słownik url: text, kategoria
     """
-    d = {}
-    for key in entry_dict:
-        text = get_filtered_text(key)
-        d[key] = (text, entry_dict[key])
-    return d
+    urls = list(entry_dict)
+    texts = get_filtered_texts(urls, processes=processes)
+    return dict((url, (text, entry_dict[url])) for url, text in zip(urls, texts))
+
+
+def get_count_matrix(entries, ngram_range=(1, 1), stemming=True, processes=1):
+    """
+    Zwraca macierz liczności słów stron dla wszystkich słów (bez ograniczenia liczby cech).
+
+    Macierz jest zapisywana w pamięci podręcznej, a jej klucz zależy od adresów, wersji stron (z metadanych
+    magazynu stron, bez czytania ich kodu) i wersji potoku przetwarzania tekstu.
+
+    :param entries: wpisy - lista słowników zawierających url i kategorię
+    :param ngram_range: zakres długości n-gramów
+    :param stemming: flaga czy stemować
+    :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
+    :returns: macierz liczności (wiersze w kolejności pierwszego wystąpienia adresu we wpisach), lista kategorii
+    """
+    entry_dict = dict_of_entries(entries)
+    ordered_urls = []
+    seen = set()
+    for entry in entries:
+        if entry['url'] not in seen:
+            seen.add(entry['url'])
+            ordered_urls.append(entry['url'])
+    urls = sorted(entry_dict)
+    page_versions = [datasource.get_page_version(url) for url in urls]
+    key = feature_cache.key(urls, page_versions, htmlparser.PIPELINE_VERSION, ngram_range, stemming)
+    matrix = feature_cache.get(key)
+    if matrix is None:
+        texts = get_filtered_texts(urls, processes=processes, stemming=stemming)
+        matrix = CountVectorizer(analyzer=TokenAnalyzer(ngram_range)).fit_transform(texts)
+        feature_cache.put(key, matrix)
+
+    positions = dict((url, i) for i, url in enumerate(urls))
+    rows = [positions[url] for url in ordered_urls]
+    return matrix[rows], [entry_dict[url] for url in ordered_urls]
+
+
+class FrequentFeatureSelector(BaseEstimator, TransformerMixin):
+    """
+    Wybiera kolumny macierzy liczności odpowiadające najczęściej występującym słowom w zbiorze uczącym,
+    tak jak parametr max_features wektoryzatora.
+    """
+
+    def __init__(self, max_features=None):
+        """
+        Konstruktor.
+
+        :param max_features: liczba wybieranych cech, None oznacza wszystkie
+        """
+        self.max_features = max_features
+
+    def fit(self, X, y=None):
+        """
+        Wybiera najczęstsze cechy.
+
+        :param X: macierz liczności
+        :returns: self
+        """
+        counts = np.asarray(X.sum(axis=0)).ravel()
+        if self.max_features is None or self.max_features >= len(counts):
+            self.columns_ = np.arange(len(counts))
+        else:
+            self.columns_ = np.sort(np.argsort(-counts, kind='mergesort')[:self.max_features])
+        return self
+
+    def transform(self, X):
+        """
+        Zwraca macierz ograniczoną do wybranych cech.
+
+        :param X: macierz liczności
+        :returns: macierz liczności wybranych cech
+        """
+        return X[:, self.columns_]
+
+
+def get_pipeline(skl_clf, max_features=1000):
+    """
+    Zwraca potok: wybór najczęstszych cech, TF-IDF i klasyfikator, działający na macierzy liczności słów.
+
+    :param skl_clf: klasyfikator scikit-learn (w potoku używana jest jego kopia)
+    :param max_features: liczba wybieranych cech
+    :returns: potok scikit-learn
+    """
+    return Pipeline([('select', FrequentFeatureSelector(max_features)),
+                     ('tfidf', TfidfTransformer()),
+                     ('clf', clone(skl_clf))])
 
 
 def get_menus_categories(entry_dict):
@@ -156,7 +256,98 @@ def get_menu_features_text(url):
     return htmlparser.get_menu_features_text(datasource.get_website(url))
 
 
-class CategoryClassifier(object):
+class BaseCategoryClassifier(object):
+    """
+    Wspólna część klasyfikatorów: klasyfikacja stron i ocena na zbiorze testowym.
+    Podklasy dostarczają wektoryzator (get_vectorizer) i sposób uczenia.
+    """
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def get_vectorizer(self):
+        """
+        Zwraca wektoryzator zamieniający przefiltrowane teksty na macierz cech.
+
+        :returns: wektoryzator scikit-learn
+        """
+
+    def copy(self):
+        """
+        Zwraca kopię klasyfikatora, którą można douczać bez zmieniania obiektu używanego do klasyfikacji.
+
+        Kopiowany jest tylko klasyfikator scikit-learn, więc koszt nie zależy od liczby tekstów treningowych.
+        Wektoryzator i teksty są współdzielone: douczanie tylko dopisuje teksty (klasyfikacja ich nie używa),
+        a pełne uczenie tworzy nowy wektoryzator.
+
+        :returns: kopia klasyfikatora
+        """
+        cl = copy.copy(self)
+        cl.clf = copy.deepcopy(self.clf)
+        return cl
+
+    def classify(self, url):
+        """
+        Klasyfikuje stronę.
+
+        :param url: adres strony
+        :type url: unicode
+        :returns: wynik klasyfikacji
+        """
+        return self.predict_texts([get_filtered_tokens(url)])[0]
+
+    def classify_many(self, urls, workers=4, processes=1):
+        """
+        Klasyfikuje wiele stron naraz - strony są pobierane równolegle, a klasyfikator jest wywoływany raz.
+
+        :param urls: lista adresów stron
+        :param workers: liczba równoległych pobrań
+        :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
+        :returns: lista wyników klasyfikacji w kolejności adresów
+        """
+        if not urls:
+            return []
+        return self.predict_texts(get_filtered_texts(urls, workers, processes))
+
+    def predict_texts(self, texts):
+        """
+        Klasyfikuje przefiltrowane teksty stron jednym wywołaniem klasyfikatora.
+
+        :param texts: lista przefiltrowanych tekstów lub list tokenów
+        :returns: lista wyników klasyfikacji
+        """
+        vectorizer = self.get_vectorizer()
+        if not isinstance(vectorizer.analyzer, TokenAnalyzer):
+            # klasyfikator zapisany przed wprowadzeniem TokenAnalyzer dzieli tekst wyrażeniem regularnym
+            texts = [text if isinstance(text, basestring) else " ".join(text) for text in texts]
+        feature_vec = vectorizer.transform(texts)
+
+        return list(self.clf.predict(feature_vec))
+
+    def accuracy(self, eval_entries, processes=1):
+        """
+        Liczy stosunek poprawnie sklasyfikowanych stron do pełnej liczby stron w zbiorze testowym.
+
+        :param eval_entries: zbiór testowy - lista słowników zawierających url i kategorię
+        :type eval_entries: list[dict[unicode,unicode]]
+        :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
+        :returns: stosunek poprawnie sklasyfikowanych stron do pełnej liczby stron w zbiorze testowym
+        """
+        gold = [entry['category'] for entry in eval_entries]
+
+        predicted = self.classify_many([entry['url'] for entry in eval_entries], processes=processes)
+        correct = [l == r for l, r in zip(gold, predicted)]
+        wrong = []
+        for predict, entry in zip(predicted, eval_entries):
+            if predict != entry['category']:
+                wrong.append(" ".join([entry['url'], predict]))
+        print wrong
+        if correct:
+            return float(sum(correct)) / len(correct)
+        else:
+            return 0
+
+
+class CategoryClassifier(BaseCategoryClassifier):
     """
     Klasa odpowiadająca za komunikację z klasyfikatorem i transformowanie cech.
     """
@@ -168,15 +359,18 @@ class CategoryClassifier(object):
         :param skl_clf: klasyfikator scikit-learn
         """
         self.clf = skl_clf
-        self.tfidf_vectorizer = TfidfVectorizer(analyzer="word",
-                                                tokenizer=None,
-                                                preprocessor=None,
-                                                stop_words=None,
+        self.tfidf_vectorizer = TfidfVectorizer(analyzer=TokenAnalyzer(),
                                                 max_features=1000)
-        self.dict_vectorizer = DictVectorizer()
-        self.entry_dict = {}
         self.texts_categories_urls = {}
 
+    def get_vectorizer(self):
+        """
+        Zwraca wektoryzator TF-IDF.
+
+        :returns: TfidfVectorizer
+        """
+        return self.tfidf_vectorizer
+
     def get_texts_categories(self):
         """
         Zwraca listę tekstów i listę kategorii na podstawie słownika będącego zmienną instancyjną klasy.
@@ -192,73 +386,95 @@ class CategoryClassifier(object):
             categories.append(category)
         return texts, categories
 
-    def train(self, entries):
+    def train(self, entries, processes=1):
         """
         Trenuje klasyfikator.
 
         :param entries: wpisy - lista słowników zawierających url i kategorię
         :type entries: list[dict[unicode,unicode]]
+        :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
         """
         entry_dict = dict_of_entries(entries)
         # self.texts_categories = get_texts_categories(self.entry_dict)
-        self.texts_categories_urls.update(get_texts_categories_url(entry_dict))
+        self.texts_categories_urls.update(get_texts_categories_url(entry_dict, processes))
+        self.fit()
+
+    def fit(self):
+        """
+        Uczy wektoryzator i klasyfikator od nowa na wszystkich zapamiętanych tekstach.
+        """
         texts, categories = self.get_texts_categories()
+        # nowy wektoryzator - dotychczasowy może być używany przez kopię klasyfikatora
+        self.tfidf_vectorizer = clone(self.tfidf_vectorizer)
         feature_vec = self.tfidf_vectorizer.fit_transform(texts)
 
         self.clf.fit(feature_vec, categories)
 
-    def classify(self, url):
+    def update(self, entries):
         """
-        Klasyfikuje stronę.
+        Douczanie klasyfikatora nowymi wpisami bez ponownego uczenia na całym zbiorze.
 
-        :param url: adres strony
-        :type url: unicode
-        :returns: wynik klasyfikacji
-        """
-        features = get_filtered_text(url)
-        feature_vec = self.tfidf_vectorizer.transform([features])
+        Słownik cech wektoryzatora pozostaje bez zmian, a klasyfikator jest aktualizowany przez partial_fit,
+        więc koszt nie zależy od liczby zapamiętanych tekstów. Jeśli klasyfikator nie wspiera douczania
+        lub pojawia się nowa kategoria, wykonywane jest pełne uczenie.
 
-        return self.clf.predict(feature_vec)[0]
+        :param entries: wpisy - lista słowników zawierających url i kategorię
+        :type entries: list[dict[unicode,unicode]]
+        """
+        self.update_texts(get_texts_categories_url(dict_of_entries(entries), processes=1))
 
-    def accuracy(self, eval_entries):
+    def update_texts(self, texts_categories):
         """
-        Liczy stosunek poprawnie sklasyfikowanych stron do pełnej liczby stron w zbiorze testowym.
+        Douczanie klasyfikatora przefiltrowanymi tekstami stron (patrz update).
+        Jeśli douczanie się nie powiedzie, słownik tekstów wraca do poprzedniego stanu.
 
-        :param eval_entries: zbiór testowy - lista słowników zawierających url i kategorię
-        :type eval_entries: list[dict[unicode,unicode]]
-        :returns: stosunek poprawnie sklasyfikowanych stron do pełnej liczby stron w zbiorze testowym
+        :param texts_categories: słownik url: (przefiltrowany tekst, kategoria)
         """
-        gold = [entry['category'] for entry in eval_entries]
+        previous = dict((url, self.texts_categories_urls.get(url)) for url in texts_categories)
+        self.texts_categories_urls.update(texts_categories)
+        try:
+            texts = [text for text, category in texts_categories.itervalues()]
+            categories = [category for text, category in texts_categories.itervalues()]
+            known = getattr(self.clf, 'classes_', [])
+            if not hasattr(self.clf, 'partial_fit') or not set(categories) <= set(known):
+                self.fit()
+                return
+
+            feature_vec = self.tfidf_vectorizer.transform(texts)
+            self.clf.partial_fit(feature_vec, categories)
+        except:
+            for url, value in previous.iteritems():
+                if value is None:
+                    del self.texts_categories_urls[url]
+                else:
+                    self.texts_categories_urls[url] = value
+            raise
+
+    def get_pipeline(self):
+        """
+        Zwraca potok odpowiadający klasyfikatorowi, działający na macierzy liczności wszystkich słów.
 
-        predicted = [self.classify(entry['url'])
-                     for entry in eval_entries]
-        correct = [l == r for l, r in zip(gold, predicted)]
-        wrong = []
-        for predict, entry in zip(predicted, eval_entries):
-            if predict != entry['category']:
-                wrong.append(" ".join([entry['url'], predict]))
-        print wrong
-        if correct:
-            return float(sum(correct)) / len(correct)
-        else:
-            return 0
+        Wybór cech i IDF są liczone w potoku, więc w walidacji krzyżowej są dopasowywane tylko
+        do zbioru uczącego danego podzbioru.
 
-    def xval(self, entries, folds):
+        :returns: potok scikit-learn
+        """
+        return get_pipeline(self.clf, getattr(self.tfidf_vectorizer, 'max_features', None))
+
+    def xval(self, entries, folds, n_jobs=-1, processes=1):
         """
         Liczy walidację krzyżowa stratyfikowaną.
 
         :param entries: wpisy
         :param folds: liczba podzbiorów na które zostanie podzielony zbiór wpisów
+        :param n_jobs: liczba procesów liczących podzbiory równolegle, -1 oznacza wszystkie rdzenie
+        :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
         :returns: wynik walidacji krzyżowej
         """
-        entry_dict = dict_of_entries(entries)
-        texts_categories = get_texts_categories(entry_dict)
+        analyzer = self.tfidf_vectorizer.analyzer
+        ngram_range = analyzer.ngram_range if isinstance(analyzer, TokenAnalyzer) else self.tfidf_vectorizer.ngram_range
+        count_vec, categories = get_count_matrix(entries, ngram_range, processes=processes)
         # menus_categories = get_menus_categories(entry_dict)
-        texts = texts_categories["texts"]
-        # menus = menus_categories["menus"]
-        # categories = menus_categories["categories"]
-        categories = texts_categories["categories"]
-        feature_vec = self.tfidf_vectorizer.fit_transform(texts)
         # menu_vec = self.tfidf_vectorizer.fit_transform(menus)
         # len_features = list(map(get_count_features, entry_dict.iterkeys()))
         # len_features = map(get_count_features, entry_dict.iterkeys())
@@ -267,5 +483,91 @@ class CategoryClassifier(object):
 
         # full_vec = scipy.sparse.hstack([feature_vec, menu_vec])
 
-        score = cross_validation.cross_val_score(self.clf, feature_vec, categories, cv=folds)
+        score = cross_validation.cross_val_score(self.get_pipeline(), count_vec, categories, cv=folds,
+                                                 n_jobs=n_jobs)
         return score, sum(score)/len(score)
+
+
+class StreamingCategoryClassifier(BaseCategoryClassifier):
+    """
+    Klasyfikator uczony strumieniowo, dla plików z wpisami zbyt dużych, by trzymać ich teksty w pamięci.
+
+    Używa bezstanowego HashingVectorizer, więc teksty mogą być przetwarzane partiami i od razu przekazywane
+    do partial_fit. Teksty nie są zapamiętywane, dlatego klasyfikator nie ma pełnego uczenia ani walidacji
+    krzyżowej. Wpisy są mieszane w buforze, bo w pliku są zwykle pogrupowane według kategorii,
+    a SGD uczony długimi ciągami jednej kategorii faworyzuje kategorie z końca pliku.
+    """
+
+    def __init__(self, skl_clf, n_features=2 ** 18):
+        """
+        Konstruktor.
+
+        :param skl_clf: klasyfikator scikit-learn wspierający partial_fit
+        :param n_features: liczba cech (kubełków funkcji skrótu)
+        """
+        self.clf = skl_clf
+        self.hashing_vectorizer = HashingVectorizer(n_features=n_features, analyzer=TokenAnalyzer())
+
+    def __setstate__(self, state):
+        """
+        Odtwarza klasyfikator z pickle, także zapisany przed zmianą nazwy zmiennej wektoryzatora.
+
+        :param state: słownik zmiennych instancyjnych
+        """
+        if 'tfidf_vectorizer' in state:
+            state['hashing_vectorizer'] = state.pop('tfidf_vectorizer')
+        self.__dict__.update(state)
+
+    def get_vectorizer(self):
+        """
+        Zwraca wektoryzator oparty na funkcji skrótu.
+
+        :returns: HashingVectorizer
+        """
+        return self.hashing_vectorizer
+
+    def train(self, entries, classes=None, chunk_size=1000, workers=4, epochs=1, buffer_size=10000, seed=123):
+        """
+        Trenuje klasyfikator strumieniowo, partiami wpisów.
+
+        :param entries: wpisy - iterowalny obiekt słowników zawierających url i kategorię; przy epochs > 1
+                        musi dać się po nim iterować wielokrotnie (np. lista lub datasource.EntryFile)
+        :param classes: lista wszystkich kategorii; jeśli nie jest podana, wpisy są wczytywane do pamięci
+        :param chunk_size: liczba stron przetwarzanych w jednej partii
+        :param workers: liczba równoległych pobrań
+        :param epochs: liczba przejść przez wszystkie wpisy
+        :param buffer_size: liczba wpisów w buforze, w którym są mieszane
+        :param seed: ziarno generatora liczb losowych używanego do mieszania
+        """
+        if classes is None:
+            entries = list(entries)
+            classes = sorted(set(entry['category'] for entry in entries))
+        rnd = random.Random(seed)
+        for epoch in xrange(epochs):
+            shuffled = datasource.iter_shuffled(entries, buffer_size, rnd)
+            for chunk in datasource.iter_chunks(shuffled, chunk_size):
+                texts = get_filtered_texts([entry['url'] for entry in chunk], workers)
+                categories = [entry['category'] for entry in chunk]
+                self.clf.partial_fit(self.hashing_vectorizer.transform(texts), categories, classes=classes)
+
+    def update(self, entries):
+        """
+        Douczanie klasyfikatora nowymi wpisami.
+
+        :param entries: wpisy - lista słowników zawierających url i kategorię
+        :type entries: list[dict[unicode,unicode]]
+        """
+        self.update_texts(get_texts_categories_url(dict_of_entries(entries), processes=1))
+
+    def update_texts(self, texts_categories):
+        """
+        Douczanie klasyfikatora przefiltrowanymi tekstami stron (patrz update).
+
+        :param texts_categories: słownik url: (przefiltrowany tekst, kategoria)
+        """
+        categories = [category for text, category in texts_categories.itervalues()]
+        unknown = set(categories) - set(self.clf.classes_)
+        if unknown:
+            raise ValueError("Unknown categories for a streaming classifier: {}".format(", ".join(unknown)))
+        texts = [text for text, category in texts_categories.itervalues()]
+        self.clf.partial_fit(self.hashing_vectorizer.transform(texts), categories)
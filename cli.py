@@ -1,7 +1,6 @@
 # coding=utf-8
 import argparse
-
-import main
+import sys
 
 
 def get_parser():
@@ -18,20 +17,61 @@ def get_parser():
     classify_parser.add_argument('--retrain', action='store_true')
     classify_parser.set_defaults(func=classify)
 
+    batch_parser = subparsers.add_parser('classify-batch')
+    batch_parser.add_argument('input', nargs='?', type=argparse.FileType('r'), default=sys.stdin)
+    batch_parser.add_argument('-f', default="websites.txt")
+    batch_parser.add_argument('--retrain', action='store_true')
+    batch_parser.add_argument('-w', '--workers', type=int, default=4)
+    batch_parser.add_argument('--chunk', type=int, default=100)
+    batch_parser.set_defaults(func=classify_batch)
+
+    stream_parser = subparsers.add_parser('train-stream')
+    stream_parser.add_argument('-f', default="websites.txt")
+    stream_parser.add_argument('--chunk', type=int, default=1000)
+    stream_parser.add_argument('-w', '--workers', type=int, default=4)
+    stream_parser.add_argument('-e', '--epochs', type=int, default=1)
+    stream_parser.add_argument('--buffer', type=int, default=10000)
+    stream_parser.set_defaults(func=train_stream)
+
     accuracy_parser = subparsers.add_parser('accuracy')
     accuracy_parser.add_argument('partition', type=float)
     accuracy_parser.add_argument('-f', default="websites.txt")
+    accuracy_parser.add_argument('-p', '--processes', type=int, default=None)
     accuracy_parser.set_defaults(func=accuracy)
 
     xval_parser = subparsers.add_parser('xval')
     xval_parser.add_argument('folds', type=int)
     xval_parser.add_argument('-f', default="websites.txt")
+    xval_parser.add_argument('-j', '--jobs', type=int, default=-1)
+    xval_parser.add_argument('-p', '--processes', type=int, default=None)
     xval_parser.set_defaults(func=cross_val)
 
+    sweep_parser = subparsers.add_parser('sweep')
+    sweep_parser.add_argument('folds', type=int)
+    sweep_parser.add_argument('-f', default="websites.txt")
+    sweep_parser.add_argument('--max-features', type=int, nargs='+', default=[1000])
+    sweep_parser.add_argument('--ngram', type=ngram_range, nargs='+', default=[(1, 1)])
+    sweep_parser.add_argument('--stemming', choices=['on', 'off'], nargs='+', default=['on'])
+    sweep_parser.add_argument('--clf', choices=['sgd', 'linearsvc', 'nb'], nargs='+', default=['sgd'])
+    sweep_parser.add_argument('-j', '--jobs', type=int, default=None)
+    sweep_parser.set_defaults(func=parameter_sweep)
+
     update_parser = subparsers.add_parser('update')
     update_parser.add_argument('url')
     update_parser.add_argument('category')
     update_parser.set_defaults(func=update)
+
+    pull_parser = subparsers.add_parser('pull')
+    pull_parser.add_argument('-f', default="websites.txt")
+    pull_parser.add_argument('-w', '--workers', type=int, default=4)
+    pull_parser.add_argument('--delay', type=float, default=1.0)
+    pull_parser.add_argument('--force', action='store_true')
+    pull_parser.set_defaults(func=pull)
+
+    migrate_parser = subparsers.add_parser('migrate')
+    migrate_parser.add_argument('-f', default="websites.txt")
+    migrate_parser.add_argument('-d', default="websites/")
+    migrate_parser.set_defaults(func=migrate)
     return parser
 
 
@@ -41,16 +81,50 @@ def classify(args):
 
     :param args: argumenty z linii komend
     """
+    import main
     print main.classify_website(args.url, force=args.retrain, filename=args.f)
 
 
+def classify_batch(args):
+    """
+    Klasyfikuje strony z pliku lub standardowego wejścia (jeden adres w linii) i wypisuje linie url|kategoria.
+
+    :param args: argumenty z linii komend
+    """
+    import main
+    urls = (line.strip() for line in args.input)
+    urls = (url for url in urls if url)
+    out = sys.stdout
+    # komunikaty diagnostyczne (pobieranie stron, uczenie) trafiają na stderr, żeby nie mieszały się z wynikami
+    sys.stdout = sys.stderr
+    try:
+        for url, category in main.classify_websites(urls, args.f, args.retrain, chunk_size=args.chunk,
+                                                    workers=args.workers):
+            out.write("{}|{}\n".format(url, category))
+            out.flush()
+    finally:
+        sys.stdout = out
+
+
+def train_stream(args):
+    """
+    Trenuje strumieniowo klasyfikator na wpisach z pliku i zapisuje go.
+
+    :param args: argumenty z linii komend
+    """
+    import main
+    main.train_streaming_classifier(args.f, args.chunk, args.workers, args.epochs, args.buffer)
+    print "Trained"
+
+
 def accuracy(args):
     """
     Zwraca stosunek poprawnie sklasyfikowanych wpisów do pełnej ich liczby.
 
     :param args: argumenty z linii komend
     """
-    print main.get_accuracy(args.partition, args.f)
+    import main
+    print main.get_accuracy(args.partition, args.f, args.processes)
 
 
 def cross_val(args):
@@ -59,7 +133,35 @@ def cross_val(args):
 
     :param args: argumenty z linii komend
     """
-    print main.get_cross_val(args.folds, args.f)
+    import main
+    print main.get_cross_val(args.folds, args.f, args.jobs, args.processes)
+
+
+def ngram_range(value):
+    """
+    Zamienia zakres n-gramów zapisany jako "min-max" na krotkę.
+
+    :param value: zakres, np. "1-2"
+    :returns: krotka (min, max)
+    """
+    try:
+        low, high = value.split("-")
+        return int(low), int(high)
+    except ValueError:
+        raise argparse.ArgumentTypeError("ngram range must look like 1-2")
+
+
+def parameter_sweep(args):
+    """
+    Wypisuje ranking zestawów ustawień według wyniku walidacji krzyżowej i czasu.
+
+    :param args: argumenty z linii komend
+    """
+    import main
+    import sweep
+    grid = sweep.get_grid(args.max_features, args.ngram, [s == 'on' for s in args.stemming], args.clf)
+    results = main.get_sweep(args.folds, grid, args.f, args.jobs)
+    print sweep.format_results(results)
 
 
 def update(args):
@@ -68,9 +170,33 @@ def update(args):
 
     :param args: argumenty z linii komend
     """
+    import main
     print main.update_website(args.url, args.category)
 
 
+def pull(args):
+    """
+    Pobiera strony z pliku z wpisami i zapisuje je na dysku.
+
+    :param args: argumenty z linii komend
+    """
+    import main
+    main.pull_websites(args.f, force=args.force, workers=args.workers, host_delay=args.delay)
+
+
+def migrate(args):
+    """
+    Przenosi zapisane strony ze starego układu katalogu do magazynu stron.
+
+    :param args: argumenty z linii komend
+    """
+    import main
+    migrated, unknown = main.migrate_websites(args.f, args.d)
+    for name in unknown:
+        print "Not migrated (no entry):", name
+    print "Migrated:", migrated
+
+
 if __name__ == '__main__':
     parser = get_parser()
     args = parser.parse_args()
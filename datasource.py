@@ -1,12 +1,17 @@
 # coding=utf-8
+import atexit
+from contextlib import contextmanager
 import csv
+import itertools
+import json
+from multiprocessing.pool import ThreadPool
 import os.path
+import random
+import threading
+import time
 import urlparse
 
-from selenium.common.exceptions import TimeoutException
-import requests
-from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
-from selenium import webdriver
+from pagestore import PageStore
 
 
 def fetch_website(url):
@@ -14,16 +19,19 @@ def fetch_website(url):
     Pobiera stronę internetową. Próbuje wykonać JS, jeśli trwa to zbyt długo pobiera html.
     
     :param url: adres strony
-    :returns: html
+    :returns: html, słownik z nagłówkami ETag/Last-Modified odpowiedzi (None jeśli stronę pobrała przeglądarka,
+              która ich nie udostępnia)
     """
+    from selenium.common.exceptions import TimeoutException
     print "Fetching", url
     full_url = get_full_url(url)
+    validators = None
     try:
         response = fetch_website_js(full_url)
     except TimeoutException:
         print "JS Timeout, fetching HTML"
-        response = fetch_website_html(full_url)
-    return response.encode('utf-8')
+        response, validators = fetch_website_html(full_url)
+    return response.encode('utf-8'), validators
 
 
 def get_full_url(url):
@@ -52,11 +60,10 @@ def fetch_website_js(url):
     :returns: html
     """
     timeout = 20
-    browser = get_browser()
-    browser.set_page_load_timeout(timeout)
-    browser.get(url)
-    response = browser.execute_script("return document.documentElement.innerHTML;")
-    browser.quit()
+    with browser_pool.browser() as browser:
+        browser.set_page_load_timeout(timeout)
+        browser.get(url)
+        response = browser.execute_script("return document.documentElement.innerHTML;")
     return response
 
 
@@ -65,13 +72,101 @@ def fetch_website_html(url):
     Pobiera html strony nie wykonując javascriptu.
 
     :param url: adres strony
-    :returns: html
+    :returns: html (None jeśli odpowiedź jest inna niż 200), słownik z nagłówkami ETag/Last-Modified
     """
-    user_agent_setting = {'User-Agent':
-                              "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/38.0.2125.111 Safari/537.36"}
-    r = requests.get(url, headers=user_agent_setting)
+    r = get_shared_session().get(url)
     if r.status_code == 200:
-        return r.text
+        return r.text, get_validators(r)
+    return None, {}
+
+
+def get_validators(response):
+    """
+    Odczytuje z odpowiedzi nagłówki ETag/Last-Modified. Brakujące nagłówki mają wartość None,
+    dzięki czemu w metadanych strony zapisywane jest również to, że serwer ich nie wysyła.
+
+    :param response: odpowiedź requests
+    :returns: słownik z nagłówkami ETag/Last-Modified
+    """
+    return {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+
+
+def get_session(pool_size=10):
+    """
+    Tworzy sesję HTTP utrzymującą połączenia (keep-alive) w puli.
+
+    :param pool_size: maksymalna liczba połączeń utrzymywanych dla jednego hosta
+    :returns: sesja requests
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    s = requests.Session()
+    s.headers['User-Agent'] = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/38.0.2125.111 Safari/537.36"
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+session = None
+session_lock = threading.Lock()
+
+
+def get_shared_session():
+    """
+    Zwraca sesję HTTP współdzieloną przez moduł, tworząc ją przy pierwszym użyciu.
+
+    :returns: sesja requests
+    """
+    global session
+    if session is None:
+        with session_lock:
+            if session is None:
+                session = get_session()
+    return session
+
+
+def revalidate_website(url):
+    """
+    Sprawdza warunkowym żądaniem HEAD, czy zapisana na dysku strona się zmieniła.
+    Żądanie nie jest wysyłane, jeśli przy stronie nie zapisano nagłówków ETag/Last-Modified.
+
+    :param url: adres strony
+    :returns: None jeśli strona się nie zmieniła (304), w.p.p. słownik z nowymi nagłówkami ETag/Last-Modified
+              (bez żądania - zapisane nagłówki; pusty, jeśli nigdy ich nie sprawdzano)
+    """
+    meta = read_meta(url)
+    headers = {}
+    if meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    if not headers:
+        return dict((key, meta[key]) for key in ('etag', 'last_modified') if key in meta)
+    status, validators = request_validators(url, headers)
+    if status == 304:
+        return None
+    return validators
+
+
+def request_validators(url, headers=None):
+    """
+    Wysyła żądanie HEAD i odczytuje nagłówki ETag/Last-Modified. Żądanie nie ma treści,
+    więc połączenie wraca do puli sesji.
+
+    :param url: adres strony
+    :param headers: dodatkowe nagłówki żądania, np. warunkowe
+    :returns: kod odpowiedzi (None po błędzie), słownik z nagłówkami ETag/Last-Modified
+    """
+    import requests
+    try:
+        r = get_shared_session().head(get_full_url(url), headers=headers, allow_redirects=True)
+    except requests.RequestException as e:
+        print "Revalidation failed: ", e
+        return None, {}
+    if r.status_code not in (200, 304):
+        return r.status_code, {}
+    return r.status_code, get_validators(r)
 
 
 def get_browser():
@@ -80,6 +175,8 @@ def get_browser():
 
     :returns: PhantomJS WebDriver
     """
+    from selenium import webdriver
+    from selenium.webdriver.common.desired_capabilities import DesiredCapabilities
     user_agent = """Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/38.0.2125.111 Safari/537.36"""
 
     dcap = dict(DesiredCapabilities.PHANTOMJS)
@@ -89,48 +186,271 @@ def get_browser():
     return driver
 
 
-def save_website(url, text):
+class BrowserPool(object):
+    """
+    Pula uruchomionych przeglądarek współdzielonych między kolejnymi pobraniami.
+
+    Przeglądarka jest wymieniana na nową po max_pages stronach lub po błędzie w trakcie pobierania.
+    Jeśli pula jest pełna, wątek czeka na zwolnienie przeglądarki albo miejsca w puli - wtedy sam tworzy
+    przeglądarkę w miejsce zamkniętej.
+    """
+
+    def __init__(self, size=1, max_pages=50, factory=get_browser):
+        """
+        Konstruktor.
+
+        :param size: maksymalna liczba jednocześnie uruchomionych przeglądarek
+        :param max_pages: liczba stron, po której przeglądarka jest zamykana i tworzona od nowa
+        :param factory: funkcja tworząca nową przeglądarkę (WebDriver)
+        """
+        self.size = size
+        self.max_pages = max_pages
+        self.factory = factory
+        self.idle = []
+        self.condition = threading.Condition()
+        self.created = 0
+        self.pages = {}
+
+    def resize(self, size):
+        """
+        Zwiększa maksymalną liczbę przeglądarek i budzi czekające wątki.
+
+        :param size: maksymalna liczba jednocześnie uruchomionych przeglądarek
+        """
+        with self.condition:
+            if size > self.size:
+                self.size = size
+                self.condition.notify_all()
+
+    def acquire(self):
+        """
+        Wydaje wolną przeglądarkę, tworząc nową jeśli pula nie jest pełna.
+        W przeciwnym razie czeka na zwolnienie przeglądarki lub miejsca w puli.
+
+        :returns: przeglądarka
+        """
+        with self.condition:
+            while not self.idle and self.created >= self.size:
+                self.condition.wait()
+            if self.idle:
+                return self.idle.pop()
+            self.created += 1
+        try:
+            browser = self.factory()
+        except:
+            with self.condition:
+                self.created -= 1
+                self.condition.notify()
+            raise
+        with self.condition:
+            self.pages[browser] = 0
+        return browser
+
+    def release(self, browser, broken=False):
+        """
+        Zwraca przeglądarkę do puli lub ją zamyka.
+
+        :param browser: przeglądarka
+        :param broken: czy podczas użycia wystąpił błąd
+        """
+        with self.condition:
+            self.pages[browser] += 1
+            if not broken and self.pages[browser] < self.max_pages:
+                self.idle.append(browser)
+                self.condition.notify()
+                return
+        self.discard(browser)
+
+    def discard(self, browser):
+        """
+        Zamyka przeglądarkę i zwalnia jej miejsce w puli, budząc wątek czekający na przeglądarkę.
+
+        :param browser: przeglądarka
+        """
+        with self.condition:
+            self.pages.pop(browser, None)
+            self.created -= 1
+            self.condition.notify()
+        try:
+            browser.quit()
+        except Exception as e:
+            print "Browser quit failed: ", e
+
+    @contextmanager
+    def browser(self):
+        """
+        Wydaje przeglądarkę na czas bloku with i oddaje ją do puli po jego zakończeniu.
+        """
+        browser = self.acquire()
+        broken = False
+        try:
+            yield browser
+        except:
+            broken = True
+            raise
+        finally:
+            self.release(browser, broken)
+
+    def warm(self):
+        """
+        Uruchamia przeglądarki aż do wypełnienia puli.
+        """
+        browsers = []
+        while self.created < self.size:
+            browsers.append(self.acquire())
+        for browser in browsers:
+            self.release(browser)
+
+    def close(self):
+        """
+        Zamyka wszystkie wolne przeglądarki.
+        """
+        while True:
+            with self.condition:
+                if not self.idle:
+                    break
+                browser = self.idle.pop()
+            self.discard(browser)
+
+
+browser_pool = BrowserPool()
+page_store = PageStore()
+atexit.register(browser_pool.close)
+
+
+def save_website(url, text, meta=None):
     """
     Zapisuje kod strony na dysku.
 
     :param url: adres strony
     :param text: kod strony
+    :param meta: dodatkowe metadane pobrania, np. nagłówki ETag/Last-Modified
     """
-    path = get_path(url)
     if text:
-        if not os.path.exists(os.path.dirname(path)):
-            os.makedirs(os.path.dirname(path))
-        with open(path, 'w+') as f:
-            f.write(text)
+        page_store.write(get_full_url(url), text, meta)
 
 
-def pull_websites(websites, force=False):
+def has_website(url):
     """
-    Pobiera strony internetowe.
+    Sprawdza czy strona jest zapisana na dysku.
+
+    :param url: adres strony
+    :returns: True jeśli strona jest zapisana
+    """
+    return page_store.exists(get_full_url(url))
+
+
+def pull_websites(websites, force=False, workers=1, host_delay=1.0):
+    """
+    Pobiera strony internetowe, opcjonalnie równolegle.
+
+    Strony z jednego hosta są pobierane pojedynczo i w odstępach co najmniej host_delay sekund.
 
     :param websites: zbiór stron do pobrania
     :param force: określa czy wymuszać pobieranie na nowo zamiast odczytywania z dysku
+    :param workers: liczba równoległych pobrań
+    :param host_delay: minimalny odstęp w sekundach między pobraniami z jednego hosta
+    :returns: lista adresów, których nie udało się pobrać
     """
     urls = []
     for site in websites:
         urls.append(site['url'])
 
-    for url in urls:
-        print "Getting:", url
-        get_website(url, force)
+    limiter = HostLimiter(host_delay)
+    browser_pool.resize(workers)
 
+    def pull(url):
+        return url, pull_website_polite(url, force, limiter)
 
-def pull_website(url):
+    pool = ThreadPool(max(1, workers))
+    failed = []
+    try:
+        for i, (url, ok) in enumerate(pool.imap_unordered(pull, urls), 1):
+            if ok:
+                print "[{}/{}] OK: {}".format(i, len(urls), url)
+            else:
+                print "[{}/{}] FAILED: {}".format(i, len(urls), url)
+                failed.append(url)
+    finally:
+        pool.close()
+        pool.join()
+    print "Done: {} ok, {} failed".format(len(urls) - len(failed), len(failed))
+    return failed
+
+
+def pull_website_polite(url, force, limiter):
     """
-    Pobiera stronę internetową i ją zapisuje na dysku.
+    Pobiera stronę, jeśli nie ma jej na dysku, z zachowaniem limitów dla hosta.
 
     :param url: adres strony
+    :param force: określa czy wymuszać pobieranie na nowo zamiast odczytywania z dysku
+    :param limiter: obiekt HostLimiter
+    :returns: True jeśli strona jest dostępna na dysku, False w.p.p.
+    """
+    if not force and has_website(url):
+        return True
+    with limiter.hold(url):
+        text = get_website(url, force=True)
+    return bool(text)
+
+
+class HostLimiter(object):
+    """
+    Ogranicza pobieranie z jednego hosta do jednego żądania naraz i minimalnego odstępu między żądaniami.
+    """
+
+    def __init__(self, delay):
+        """
+        Konstruktor.
+
+        :param delay: minimalny odstęp w sekundach między żądaniami do jednego hosta
+        """
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.host_locks = {}
+        self.last_request = {}
+
+    @contextmanager
+    def hold(self, url):
+        """
+        Blokuje host strony na czas pobierania.
+
+        :param url: adres strony
+        """
+        host = urlparse.urlparse(get_full_url(url)).netloc
+        with self.lock:
+            host_lock = self.host_locks.setdefault(host, threading.Lock())
+        with host_lock:
+            wait = self.last_request.get(host, 0) + self.delay - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                yield
+            finally:
+                self.last_request[host] = time.time()
+
+
+def pull_website(url, validators=None):
+    """
+    Pobiera stronę internetową i ją zapisuje na dysku razem z nagłówkami ETag/Last-Modified.
+    Nagłówki są brane z odpowiedzi; żądanie HEAD jest wysyłane tylko po pobraniu strony przeglądarką,
+    jeśli nagłówki nie są już znane.
+
+    :param url: adres strony
+    :param validators: znane nagłówki ETag/Last-Modified strony, np. z rewalidacji
     :returns: kod strony
     """
     text = ""
     try:
-        text = fetch_website(url)
-        save_website(url, text)
+        text, fetched = fetch_website(url)
+        if fetched is None:
+            fetched = validators
+        if not fetched:
+            status, fetched = request_validators(url)
+            if status is not None and not fetched:
+                # odpowiedź inna niż 200/304 - zapisywany jest brak nagłówków, żeby nie pytać ponownie
+                fetched = {'etag': None, 'last_modified': None}
+        save_website(url, text, fetched)
     except Exception as e:
         print "An error occured: ", e
     return text
@@ -143,26 +463,111 @@ def read_entries(filename):
     :param filename: ścieżka do pliku
     :returns: wpisy
     """
-    entries = []
+    return list(iter_entries(filename))
+
+
+def iter_entries(filename):
+    """
+    Odczytuje wpisy z pliku csv po jednym, bez wczytywania całego pliku do pamięci.
+
+    :param filename: ścieżka do pliku
+    :returns: generator wpisów
+    """
     with open(filename) as csvfile:
         reader = csv.DictReader(csvfile, delimiter='|')
         for row in reader:
-            entries.append(row)
-    return entries
+            yield row
+
+
+class EntryFile(object):
+    """
+    Plik z wpisami, po którym można iterować wielokrotnie (np. w kolejnych epokach uczenia),
+    za każdym razem czytając go strumieniowo.
+    """
+
+    def __init__(self, filename):
+        """
+        Konstruktor.
+
+        :param filename: ścieżka do pliku
+        """
+        self.filename = filename
 
+    def __iter__(self):
+        """
+        Zwraca generator wpisów z pliku.
 
-def get_path(url):
+        :returns: generator wpisów
+        """
+        return iter_entries(self.filename)
+
+
+def read_categories(filename):
+    """
+    Odczytuje zbiór kategorii występujących w pliku z wpisami.
+
+    :param filename: ścieżka do pliku
+    :returns: posortowana lista kategorii
+    """
+    return sorted(set(entry['category'] for entry in iter_entries(filename)))
+
+
+def iter_chunks(iterable, chunk_size):
+    """
+    Dzieli ciąg na kolejne listy o zadanej długości.
+
+    :param iterable: dowolny iterowalny obiekt
+    :param chunk_size: długość listy
+    :returns: generator list
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_shuffled(iterable, buffer_size, rnd=random):
+    """
+    Miesza ciąg w buforze o zadanej długości, bez wczytywania całego ciągu do pamięci.
+    Element jest wydawany z losowego miejsca bufora i zastępowany kolejnym elementem ciągu.
+
+    :param iterable: dowolny iterowalny obiekt
+    :param buffer_size: długość bufora, wartość mniejsza niż 2 wyłącza mieszanie
+    :param rnd: generator liczb losowych (random.Random)
+    :returns: generator elementów w losowej kolejności
+    """
+    if buffer_size <= 1:
+        for item in iterable:
+            yield item
+        return
+    buf = []
+    for item in iterable:
+        if len(buf) < buffer_size:
+            buf.append(item)
+            continue
+        i = rnd.randrange(buffer_size)
+        yield buf[i]
+        buf[i] = item
+    rnd.shuffle(buf)
+    for item in buf:
+        yield item
+
+
+def get_path(url, directory="websites/"):
     """
-    Zwrraca ścieżkę do pliku z zapisaną stroną internetową.
+    Zwrraca ścieżkę do pliku z zapisaną stroną internetową w starym, płaskim układzie katalogu websites/.
+    Używane tylko przy migracji do magazynu stron.
 
     :param url: adres strony
+    :param directory: katalog w starym układzie
     :returns: ścieżka
     """
-    directory = "websites/"
     ext = ""
     if not (url.endswith("html") or url.endswith("htm")):
         ext = ".html"
-    return directory + escape_filename(url) + ext
+    return os.path.join(directory, escape_filename(url) + ext)
 
 
 def escape_filename(url):
@@ -186,13 +591,89 @@ def get_website(url, force=False):
     :param force: określa czy wymuszać pobieranie na nowo zamiast odczytywania z dysku
     :returns: html
     """
-    if not force:
-        path = get_path(url)
-        if os.path.exists(path):
-            with open(path, 'r') as f:
-                return f.read()
-    text = pull_website(url)
-    return text
+    full_url = get_full_url(url)
+    validators = {}
+    if page_store.exists(full_url):
+        if force:
+            validators = revalidate_website(url)
+        if not force or validators is None:
+            return page_store.read(full_url)
+    return pull_website(url, validators)
+
+
+@contextmanager
+def open_website(url):
+    """
+    Udostępnia kod strony zapisanej na dysku bez kopiowania (mmap), pobierając ją jeśli nie jest zapisana.
+    Bufor jest ważny tylko wewnątrz bloku with.
+
+    :param url: adres strony
+    :returns: bufor z kodem strony
+    """
+    full_url = get_full_url(url)
+    if not page_store.exists(full_url):
+        yield get_website(url)
+        return
+    with page_store.open(full_url) as buf:
+        yield buf
+
+
+def read_meta(url):
+    """
+    Odczytuje metadane zapisanej strony, m.in. nagłówki ETag/Last-Modified.
+
+    :param url: adres strony
+    :returns: słownik z metadanymi, pusty jeśli nie zostały zapisane
+    """
+    return page_store.read_meta(get_full_url(url))
+
+
+def get_page_version(url):
+    """
+    Zwraca identyfikator wersji zapisanej strony (z metadanych, bez czytania kodu strony).
+
+    :param url: adres strony
+    :returns: identyfikator wersji lub None jeśli strona nie jest zapisana
+    """
+    return page_store.version(get_full_url(url))
+
+
+def migrate_flat_layout(entries, directory="websites/"):
+    """
+    Przenosi strony ze starego, płaskiego katalogu websites/ do magazynu stron.
+
+    Nazwy plików w starym układzie nie pozwalają odtworzyć adresu, dlatego migrowane są strony z listy wpisów.
+    Stare pliki nie są usuwane.
+
+    :param entries: wpisy - lista słowników zawierających url
+    :param directory: katalog w starym układzie
+    :returns: liczba przeniesionych stron, lista plików starego układu, które nie odpowiadają żadnemu wpisowi
+    """
+    migrated = 0
+    known = set()
+    for entry in entries:
+        url = entry['url']
+        path = get_path(url, directory)
+        known.add(os.path.basename(path))
+        if not os.path.exists(path) or has_website(url):
+            continue
+        with open(path, 'rb') as f:
+            text = f.read()
+        meta = {}
+        try:
+            with open(path + ".meta", 'r') as f:
+                meta = json.load(f)
+        except (IOError, ValueError):
+            pass
+        meta['fetched_at'] = os.path.getmtime(path)
+        save_website(url, text, meta)
+        migrated += 1
+
+    unknown = []
+    if os.path.exists(directory):
+        unknown = [name for name in sorted(os.listdir(directory))
+                   if not name.endswith(".meta") and name not in known]
+    return migrated, unknown
 
 
 def get_raw_entries(filename="websites.txt"):
@@ -0,0 +1,129 @@
+# coding=utf-8
+import hashlib
+import os
+
+import numpy as np
+import scipy.sparse
+
+
+class FeatureCache(object):
+    """
+    Dyskowa pamięć podręczna macierzy cech (macierzy rzadkich CSR) zapisywanych w formacie NumPy.
+    Po przekroczeniu maksymalnego rozmiaru usuwane są najdawniej używane wpisy.
+    """
+
+    def __init__(self, directory="cache/features/", max_size=1024 * 1024 * 1024):
+        """
+        Konstruktor.
+
+        :param directory: katalog z zapisanymi macierzami
+        :param max_size: maksymalny łączny rozmiar plików w bajtach
+        """
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, *params):
+        """
+        Zwraca klucz wpisu.
+
+        :param params: parametry, od których zależy macierz
+        :returns: skrót sha1
+        """
+        h = hashlib.sha1()
+        for param in params:
+            h.update(repr(param))
+            h.update("|")
+        return h.hexdigest()
+
+    def get_path(self, key):
+        """
+        Zwraca ścieżkę do pliku wpisu.
+
+        :param key: klucz wpisu
+        :returns: ścieżka
+        """
+        return os.path.join(self.directory, key + ".npz")
+
+    def get(self, key):
+        """
+        Odczytuje macierz z pamięci podręcznej.
+
+        :param key: klucz wpisu
+        :returns: macierz CSR lub None jeśli nie ma wpisu lub nie da się go odczytać
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                arrays = np.load(f)
+                matrix = scipy.sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                                 shape=tuple(arrays['shape']))
+            # czas modyfikacji służy jako czas ostatniego użycia
+            os.utime(path, None)
+            return matrix
+        except (IOError, OSError):
+            return None
+        except Exception as e:
+            # uszkodzony plik (np. BadZipfile, ValueError, KeyError) - macierz zostanie policzona i zapisana od nowa
+            print "Feature cache entry {} unreadable: {}".format(key, e)
+            return None
+
+    def put(self, key, matrix):
+        """
+        Zapisuje macierz w pamięci podręcznej.
+
+        :param key: klucz wpisu
+        :param matrix: macierz rzadka
+        """
+        matrix = scipy.sparse.csr_matrix(matrix)
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+        path = self.get_path(key)
+        tmpname = "{}.{}.tmp".format(path, os.getpid())
+        try:
+            with open(tmpname, 'wb') as f:
+                np.savez(f, data=matrix.data, indices=matrix.indices, indptr=matrix.indptr,
+                         shape=np.array(matrix.shape))
+            # podmiana pliku jest atomowa, więc przerwany zapis nie zostawi niepełnego wpisu
+            os.rename(tmpname, path)
+        except:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+            raise
+        self.evict()
+
+    def get_files(self):
+        """
+        Zwraca listę plików wpisów.
+
+        :returns: lista krotek (czas ostatniego użycia, rozmiar, ścieżka)
+        """
+        files = []
+        if not os.path.exists(self.directory):
+            return files
+        for name in os.listdir(self.directory):
+            if not name.endswith(".npz"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def evict(self):
+        """
+        Usuwa najdawniej używane wpisy, jeśli łączny rozmiar przekracza maksymalny.
+        Wpisów jest niewiele (po jednym na zbiór stron i parametry), więc rozmiar jest liczony przy każdym zapisie.
+        """
+        files = sorted(self.get_files())
+        size = sum(file_size for mtime, file_size, path in files)
+        # najnowszy wpis (właśnie zapisany) zostaje nawet jeśli sam przekracza limit
+        for mtime, file_size, path in files[:-1]:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= file_size
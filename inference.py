@@ -0,0 +1,344 @@
+# coding=utf-8
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+
+import numpy as np
+import scipy.sparse
+
+import htmlparser
+
+# czas w sekundach, przez który zastąpiona wersja modelu pozostaje na dysku - procesy, które odczytały
+# wcześniej current.json, mogą ją jeszcze wczytywać
+VERSION_GRACE = 600
+
+
+class InferenceModel(object):
+    """
+    Zwarty model służący wyłącznie do klasyfikacji.
+
+    Zawiera tylko słownik, wektor IDF i współczynniki liniowego klasyfikatora, zapisane jako pliki .npy,
+    które są mapowane w pamięci przy wczytywaniu. Nie zawiera tekstów treningowych, więc jego rozmiar
+    nie zależy od liczby stron w zbiorze uczącym.
+    """
+
+    def __init__(self, meta, arrays):
+        """
+        Konstruktor.
+
+        :param meta: słownik z ustawieniami wektoryzatora, listą kategorii i wersją modelu
+        :param arrays: słownik tablic numpy (terms, columns, idf, coef, intercept)
+        """
+        self.meta = meta
+        self.version = meta['version']
+        self.classes = meta['classes']
+        self.terms = arrays.get('terms')
+        self.columns = arrays.get('columns')
+        self.idf = arrays.get('idf')
+        self.coef = arrays['coef']
+        self.intercept = arrays['intercept']
+        self.hashing_vectorizer = None
+        self.token_pattern = None
+        if meta.get('analyzer') == 'tokens':
+            self.analyzer = htmlparser.TokenAnalyzer(meta['ngram_range'])
+        elif meta['kind'] == 'tfidf':
+            # model zapisany z wektoryzatorem dzielącym tekst wyrażeniem regularnym
+            self.token_pattern = re.compile(meta['token_pattern'], re.UNICODE)
+
+    def analyze(self, text):
+        """
+        Dzieli tekst na cechy (słowa lub n-gramy) tak jak wektoryzator, na którym model był uczony.
+
+        :param text: przefiltrowany tekst strony lub lista jego tokenów
+        :returns: lista cech
+        """
+        if self.token_pattern is None:
+            return self.analyzer(text)
+        if not isinstance(text, basestring):
+            text = " ".join(text)
+        if self.meta['lowercase']:
+            text = text.lower()
+        tokens = self.token_pattern.findall(text)
+        min_n, max_n = self.meta['ngram_range']
+        if max_n == 1:
+            return tokens
+        original_tokens = tokens
+        tokens = original_tokens[:] if min_n == 1 else []
+        for n in xrange(max(min_n, 2), min(max_n + 1, len(original_tokens) + 1)):
+            for i in xrange(len(original_tokens) - n + 1):
+                tokens.append(" ".join(original_tokens[i: i + n]))
+        return tokens
+
+    def transform(self, texts):
+        """
+        Zamienia teksty na macierz cech.
+
+        :param texts: lista przefiltrowanych tekstów lub list tokenów
+        :returns: macierz rzadka CSR
+        """
+        if self.meta['kind'] == 'hashing':
+            if self.meta.get('analyzer') != 'tokens':
+                texts = [text if isinstance(text, basestring) else " ".join(text) for text in texts]
+            return self.get_hashing_vectorizer().transform(texts)
+
+        rows = []
+        cols = []
+        for i, text in enumerate(texts):
+            tokens = self.analyze(text)
+            if not tokens or not len(self.terms):
+                continue
+            tokens = np.array(tokens)
+            positions = np.searchsorted(self.terms, tokens).clip(0, len(self.terms) - 1)
+            found = self.terms[positions] == tokens
+            cols.append(self.columns[positions[found]])
+            rows.append(np.repeat(i, found.sum()))
+        n_features = len(self.idf)
+        if cols:
+            rows = np.concatenate(rows)
+            cols = np.concatenate(cols)
+        dtype = np.dtype(self.meta.get('dtype', 'float64'))
+        if dtype.kind != 'f' or self.meta['use_idf']:
+            # jak w TfidfTransformer - całkowite liczności i mnożenie przez IDF dają float64
+            dtype = np.dtype(np.float64)
+        matrix = scipy.sparse.csr_matrix((np.ones(len(cols), dtype=dtype), (rows, cols)),
+                                         shape=(len(texts), n_features), dtype=dtype)
+        matrix.sum_duplicates()
+        if self.meta.get('binary'):
+            matrix.data.fill(1)
+
+        if self.meta['sublinear_tf']:
+            matrix.data = np.log(matrix.data) + 1
+        if self.meta['use_idf']:
+            matrix.data *= self.idf[matrix.indices]
+        if self.meta['norm'] == 'l2':
+            norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        elif self.meta['norm'] == 'l1':
+            norms = np.asarray(abs(matrix).sum(axis=1)).ravel()
+        else:
+            return matrix
+        norms[norms == 0] = 1
+        matrix.data /= np.repeat(norms, np.diff(matrix.indptr))
+        return matrix
+
+    def get_hashing_vectorizer(self):
+        """
+        Zwraca bezstanowy HashingVectorizer odtworzony z zapisanych ustawień.
+
+        :returns: HashingVectorizer
+        """
+        if self.hashing_vectorizer is None:
+            from sklearn.feature_extraction.text import HashingVectorizer
+            params = dict(self.meta['vectorizer'])
+            params['ngram_range'] = tuple(params['ngram_range'])
+            if self.meta.get('analyzer') == 'tokens':
+                params['analyzer'] = self.analyzer
+            if 'dtype' in self.meta:
+                params['dtype'] = np.dtype(self.meta['dtype'])
+            self.hashing_vectorizer = HashingVectorizer(**params)
+        return self.hashing_vectorizer
+
+    def predict(self, matrix):
+        """
+        Przewiduje kategorie.
+
+        :param matrix: macierz cech
+        :returns: lista kategorii
+        """
+        scores = np.asarray(matrix.dot(self.coef.T)) + self.intercept
+        if scores.shape[1] == 1:
+            indices = (scores[:, 0] > 0).astype(int)
+        else:
+            indices = scores.argmax(axis=1)
+        return [self.classes[i] for i in indices]
+
+    def classify(self, url):
+        """
+        Klasyfikuje stronę.
+
+        :param url: adres strony
+        :type url: unicode
+        :returns: wynik klasyfikacji
+        """
+        return self.predict_texts([htmlparser.get_filtered_tokens(url)])[0]
+
+    def classify_many(self, urls, workers=4):
+        """
+        Klasyfikuje wiele stron naraz.
+
+        :param urls: lista adresów stron
+        :param workers: liczba równoległych pobrań
+        :returns: lista wyników klasyfikacji w kolejności adresów
+        """
+        if not urls:
+            return []
+        return self.predict_texts(htmlparser.get_filtered_texts(urls, workers))
+
+    def predict_texts(self, texts):
+        """
+        Klasyfikuje przefiltrowane teksty stron.
+
+        :param texts: lista przefiltrowanych tekstów lub list tokenów
+        :returns: lista wyników klasyfikacji
+        """
+        return self.predict(self.transform(texts))
+
+
+def get_model_data(cl):
+    """
+    Wyciąga z klasyfikatora dane potrzebne do klasyfikacji.
+
+    :param cl: CategoryClassifier lub StreamingCategoryClassifier z liniowym klasyfikatorem
+    :returns: słownik ustawień, słownik tablic numpy
+    :raises ValueError: jeśli wektoryzatora lub klasyfikatora nie da się zapisać w zwartej postaci
+    """
+    vectorizer = cl.get_vectorizer()
+    params = vectorizer.get_params()
+    meta = {'classes': list(cl.clf.classes_), 'dtype': np.dtype(params['dtype']).name}
+    arrays = {}
+    analyzer = params['analyzer']
+    if hasattr(vectorizer, 'vocabulary_'):
+        meta.update({'kind': 'tfidf', 'norm': params['norm'], 'use_idf': params['use_idf'],
+                     'sublinear_tf': params['sublinear_tf'], 'binary': params['binary']})
+        if isinstance(analyzer, htmlparser.TokenAnalyzer):
+            meta.update({'analyzer': 'tokens', 'ngram_range': list(analyzer.ngram_range)})
+        elif analyzer != 'word' or params['tokenizer'] or params['preprocessor'] or params['stop_words'] \
+                or params['strip_accents'] or params['input'] != 'content':
+            raise ValueError("Unsupported vectorizer settings")
+        else:
+            meta.update({'lowercase': params['lowercase'], 'token_pattern': params['token_pattern'],
+                         'ngram_range': list(params['ngram_range'])})
+        terms = sorted(vectorizer.vocabulary_)
+        arrays['terms'] = np.array(terms, dtype=unicode)
+        arrays['columns'] = np.array([vectorizer.vocabulary_[t] for t in terms], dtype=np.int32)
+        if params['use_idf']:
+            arrays['idf'] = vectorizer.idf_
+        else:
+            arrays['idf'] = np.ones(len(terms))
+    elif params.get('n_features') and isinstance(analyzer, htmlparser.TokenAnalyzer):
+        meta.update({'kind': 'hashing', 'analyzer': 'tokens', 'ngram_range': list(analyzer.ngram_range),
+                     'vectorizer': dict((k, v) for k, v in params.iteritems() if k not in ('dtype', 'analyzer'))})
+    elif params.get('n_features') and not callable(analyzer) and not params['tokenizer'] \
+            and not params['preprocessor']:
+        meta.update({'kind': 'hashing', 'vectorizer': dict((k, v) for k, v in params.iteritems() if k != 'dtype')})
+    else:
+        raise ValueError("Unsupported vectorizer")
+
+    if hasattr(cl.clf, 'feature_log_prob_'):
+        arrays['coef'] = cl.clf.feature_log_prob_
+        arrays['intercept'] = cl.clf.class_log_prior_
+    elif hasattr(cl.clf, 'coef_') and hasattr(cl.clf, 'intercept_'):
+        arrays['coef'] = cl.clf.coef_
+        arrays['intercept'] = cl.clf.intercept_
+    else:
+        raise ValueError("Only linear classifiers can be saved as an inference model")
+    if scipy.sparse.issparse(arrays['coef']):
+        arrays['coef'] = arrays['coef'].toarray()
+    return meta, arrays
+
+
+def get_current_path(directory):
+    """
+    Zwraca ścieżkę do pliku wskazującego aktualną wersję modelu.
+
+    :param directory: katalog modelu
+    :returns: ścieżka
+    """
+    return os.path.join(directory, "current.json")
+
+
+def save_inference_model(cl, directory):
+    """
+    Zapisuje zwarty model w nowym podkatalogu wersji i atomowo przełącza na niego plik current.json.
+    Zastąpione wersje są usuwane dopiero VERSION_GRACE sekund po zastąpieniu, bo mogą z nich jeszcze
+    korzystać inne procesy.
+
+    :param cl: CategoryClassifier
+    :param directory: katalog modelu
+    :returns: wersja modelu
+    :raises ValueError: jeśli klasyfikatora nie da się zapisać w zwartej postaci
+    """
+    meta, arrays = get_model_data(cl)
+    version = uuid.uuid4().hex
+    meta['version'] = version
+    version_dir = os.path.join(directory, version)
+    os.makedirs(version_dir)
+    for name, array in arrays.iteritems():
+        np.save(os.path.join(version_dir, name + ".npy"), np.ascontiguousarray(array))
+    with open(os.path.join(version_dir, "meta.json"), 'w') as f:
+        json.dump(meta, f)
+
+    current_path = get_current_path(directory)
+    previous = read_current_version(current_path)
+    tmpname = "{}.{}.tmp".format(current_path, os.getpid())
+    with open(tmpname, 'w') as f:
+        json.dump({'version': version}, f)
+    os.rename(tmpname, current_path)
+
+    if previous is not None:
+        # czas modyfikacji katalogu oznacza moment zastąpienia wersji
+        try:
+            os.utime(os.path.join(directory, previous), None)
+        except OSError:
+            pass
+    expired = time.time() - VERSION_GRACE
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name != version and os.path.isdir(path) and os.path.getmtime(path) < expired:
+                shutil.rmtree(path, ignore_errors=True)
+        except OSError:
+            continue
+    return version
+
+
+def read_current_version(current_path):
+    """
+    Odczytuje aktualną wersję modelu.
+
+    :param current_path: ścieżka do pliku current.json
+    :returns: wersja lub None jeśli model nie był zapisany
+    """
+    try:
+        with open(current_path, 'r') as f:
+            return json.load(f)['version']
+    except (IOError, ValueError, KeyError):
+        return None
+
+
+def load_inference_model(current_path, attempts=3):
+    """
+    Wczytuje aktualną wersję zwartego modelu. Tablice są mapowane w pamięci (tylko do odczytu).
+    Jeśli wersja zniknęła w trakcie wczytywania, plik current.json jest odczytywany ponownie.
+
+    :param current_path: ścieżka do pliku current.json w katalogu modelu
+    :param attempts: liczba prób
+    :returns: InferenceModel
+    """
+    for attempt in xrange(attempts):
+        version = read_current_version(current_path)
+        if version is None:
+            raise IOError("No inference model at {}".format(current_path))
+        try:
+            return load_version(os.path.join(os.path.dirname(current_path), version))
+        except (IOError, OSError):
+            if attempt == attempts - 1:
+                raise
+
+
+def load_version(version_dir):
+    """
+    Wczytuje jedną wersję zwartego modelu.
+
+    :param version_dir: katalog wersji
+    :returns: InferenceModel
+    """
+    with open(os.path.join(version_dir, "meta.json"), 'r') as f:
+        meta = json.load(f)
+    arrays = {}
+    for name in os.listdir(version_dir):
+        if name.endswith(".npy"):
+            arrays[name[:-4]] = np.load(os.path.join(version_dir, name), mmap_mode='r')
+    return InferenceModel(meta, arrays)
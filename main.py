@@ -1,42 +1,169 @@
 # coding=utf-8
+from contextlib import contextmanager
 import cPickle as pickle
+import fcntl
+import json
+import os
 import random
+import threading
 
-import classifier
 import datasource
+import inference
+from registry import ModelRegistry, get_file_stamp
+from resultcache import DiskBackend, ResultCache
 
 
-def classify_website(url, filename, force):
+def classify_website(url, filename, force, predictor=None):
     """
     Klasyfikuje stronę.
 
     :param url: adres strony
     :param filename: plik z wpisami treningowymi
     :param force: wymusza ponowne nauczenie klasyfikatora
+    :param predictor: opcjonalny serving.BatchingPredictor łączący przewidywania równoległych żądań
     :returns: przewidziana kategoria
     """
+    if not force:
+        result = result_cache.get(url, get_model_version(filename))
+        if result is not None:
+            return result
     print "getting"
-    cl = get_classifier(filename=filename, force=force)
+    cl = get_inference_model(filename=filename, force=force)
     print "get cl"
-    result = cl.classify(url)
+    if predictor is not None:
+        result = predictor.classify(cl, url)
+    else:
+        result = cl.classify(url)
+    if getattr(cl, 'version', None):
+        result_cache.put(url, cl.version, result)
     return result
 
 
-def update_website(url, category):
+def classify_websites(urls, filename, force, chunk_size=100, workers=4):
+    """
+    Klasyfikuje wiele stron, zwracając wyniki partiami w miarę ich obliczania.
+
+    :param urls: adresy stron (dowolny iterowalny obiekt)
+    :param filename: plik z wpisami treningowymi
+    :param force: wymusza ponowne nauczenie klasyfikatora
+    :param chunk_size: liczba stron klasyfikowanych w jednej partii
+    :param workers: liczba równoległych pobrań
+    :returns: generator par (adres, przewidziana kategoria)
+    """
+    cl = get_inference_model(filename=filename, force=force)
+    version = getattr(cl, 'version', None)
+    for chunk in datasource.iter_chunks(urls, chunk_size):
+        results = {}
+        if version:
+            for url in chunk:
+                results[url] = result_cache.get(url, version)
+        missing = [url for url in chunk if results.get(url) is None]
+        for url, category in zip(missing, cl.classify_many(missing, workers)):
+            results[url] = category
+            if version:
+                result_cache.put(url, version, category)
+        for url in chunk:
+            yield url, results[url]
+
+
+# liczba douczeń, po której pełny klasyfikator jest zapisywany od nowa - wcześniej poprawki są tylko dopisywane
+# do dziennika obok pliku klasyfikatora
+CHECKPOINT_INTERVAL = 20
+update_lock = threading.Lock()
+
+
+def update_website(url, category, filename="websites.txt", partition=1):
     """
     Funkcja służąca do douczania klasyfikatora.
 
+    Douczana jest kopia klasyfikatora, która po douczeniu zastępuje w rejestrze klasyfikator używany przez
+    inne wątki. Poprawka (razem z przefiltrowanym tekstem strony) jest dopisywana do dziennika, a pełny
+    klasyfikator (z tekstami treningowymi) jest zapisywany dopiero co CHECKPOINT_INTERVAL poprawek.
+    Douczanie jest wykonywane pod blokadą pliku, więc poprawki z innych procesów (dopisane do dziennika)
+    są wczytywane przed douczeniem i nie giną.
+
     :param url: adres strony
     :param category: poprawna kategoria
+    :param filename: ścieżka do pliku z wpisami uczącymi
+    :param partition: float, część wpisów jaka ma znaleźć się w zbiorze treningowym
     :returns: Komunikat o powodzeniu
     """
-    cl = get_classifier()
-    entry = [{'category': category, 'url': url}]
-    cl.train(entry)
-    save_classifier(cl)
+    import classifier
+    # tekst jest wyciągany przed blokadą - pobieranie strony nie wstrzymuje innych poprawek
+    texts_categories = classifier.get_texts_categories_url({url: category}, processes=1)
+    entries = [{'url': u, 'category': c, 'text': text} for u, (text, c) in texts_categories.iteritems()]
+    picklename = get_classifier_picklename(filename, partition)
+    with locked(picklename):
+        cl = get_classifier(filename, partition).copy()
+        cl.update_texts(texts_categories)
+        pending = append_updates(picklename, entries)
+        save_classifier(cl, filename, partition, training_state=pending >= CHECKPOINT_INTERVAL)
+        registry.put(picklename, cl)
     return "Updated"
 
 
+@contextmanager
+def locked(picklename):
+    """
+    Blokuje douczanie klasyfikatora w tym i w innych procesach na czas bloku with.
+
+    :param picklename: nazwa pliku klasyfikatora
+    """
+    with update_lock:
+        with open(picklename + ".lock", 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_updates_filename(picklename):
+    """
+    Zwraca nazwę pliku dziennika poprawek zapisanych po ostatnim zapisie pełnego klasyfikatora.
+
+    :param picklename: nazwa pliku klasyfikatora
+    :returns: nazwa pliku
+    """
+    return picklename + ".updates"
+
+
+def append_updates(picklename, entries):
+    """
+    Dopisuje poprawki do dziennika.
+
+    :param picklename: nazwa pliku klasyfikatora
+    :param entries: wpisy - lista słowników zawierających url, kategorię i przefiltrowany tekst strony
+    :returns: liczba poprawek w dzienniku
+    """
+    with open(get_updates_filename(picklename), 'a') as f:
+        f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+    return len(read_updates(picklename))
+
+
+def read_updates(picklename, size=-1):
+    """
+    Odczytuje poprawki z dziennika.
+
+    :param picklename: nazwa pliku klasyfikatora
+    :param size: liczba odczytywanych bajtów dziennika, domyślnie cały dziennik
+    :returns: wpisy - lista słowników zawierających url, kategorię i przefiltrowany tekst strony
+    """
+    try:
+        with open(get_updates_filename(picklename), 'r') as f:
+            lines = f.read(size).splitlines()
+    except IOError:
+        return []
+    entries = []
+    for line in lines:
+        try:
+            entries.append(json.loads(line))
+        except ValueError:
+            # niedokończony zapis ostatniej linii
+            continue
+    return entries
+
+
 def get_classifier(filename="websites.txt", partition=1, force=False):
     """
     Zwraca wytrenowany klasyfikator, trenowany na nowo lub odczytany z pliku.
@@ -48,7 +175,7 @@ def get_classifier(filename="websites.txt", partition=1, force=False):
     """
     if not force:
         try:
-            return load_classifier(filename, partition)
+            return registry.get(get_classifier_picklename(filename, partition))
         except:
             pass
     print "training"
@@ -57,6 +184,62 @@ def get_classifier(filename="websites.txt", partition=1, force=False):
     return cl
 
 
+def train_streaming_classifier(filename, chunk_size=1000, workers=4, epochs=1, buffer_size=10000):
+    """
+    Trenuje strumieniowo klasyfikator na wszystkich wpisach z pliku i zapisuje go.
+    Wpisy są czytane z pliku partiami, więc zużycie pamięci nie zależy od liczby wpisów.
+
+    :param filename: ścieżka do pliku z wpisami
+    :param chunk_size: liczba stron przetwarzanych w jednej partii
+    :param workers: liczba równoległych pobrań
+    :param epochs: liczba przejść przez plik z wpisami
+    :param buffer_size: liczba wpisów w buforze, w którym są mieszane
+    :returns: klasyfikator
+    """
+    import classifier
+    classes = datasource.read_categories(filename)
+    cl = classifier.get_streaming_classifier()
+    cl.train(datasource.EntryFile(filename), classes, chunk_size, workers, epochs, buffer_size)
+    save_classifier(cl, filename)
+    return cl
+
+
+def get_inference_model(filename="websites.txt", partition=1, force=False):
+    """
+    Zwraca zwarty model do klasyfikacji, trzymany w pamięci procesu.
+    Jeśli modelu nie ma na dysku, jest tworzony z pełnego klasyfikatora.
+
+    :param filename: ścieżka do pliku z wpisami uczącymi
+    :param partition: float, część wpisów jaka ma znaleźć się w zbiorze treningowym
+    :param force: wymusza ponowne uczenie
+    :returns: model z metodami classify i classify_many
+    """
+    current_path = inference.get_current_path(get_model_dirname(filename, partition))
+    if not force:
+        try:
+            return registry.get(current_path)
+        except (IOError, OSError):
+            pass
+    cl = get_classifier(filename, partition, force)
+    if not os.path.exists(current_path):
+        try:
+            inference.save_inference_model(cl, get_model_dirname(filename, partition))
+        except ValueError:
+            return cl
+    return registry.get(current_path)
+
+
+def get_model_version(filename="websites.txt", partition=1):
+    """
+    Zwraca wersję zapisanego zwartego modelu bez wczytywania go.
+
+    :param filename: ścieżka do pliku z wpisami uczącymi
+    :param partition: float, część wpisów jaka ma znaleźć się w zbiorze treningowym
+    :returns: wersja lub None jeśli model nie był zapisany
+    """
+    return inference.read_current_version(inference.get_current_path(get_model_dirname(filename, partition)))
+
+
 def get_train_eval_sets(filename, partition):
     """
     Odczytuje wpisy i rozdziela zbiór wpisów na zbiór treningowy i testujący.
@@ -65,6 +248,7 @@ def get_train_eval_sets(filename, partition):
     :param partition: float, część jaka ma znaleźć się w zbiorze treningowym
     :returns: zbiór trenignowy, zbiór testujący
     """
+    import classifier
     entries = datasource.get_raw_entries(filename)
     train_set, eval_set = classifier.get_train_eval_sets(entries, partition)
     return train_set, eval_set
@@ -78,22 +262,48 @@ def train_classifier(filename, partition):
     :param partition: float, część jaka ma znaleźć się w zbiorze treningowym
     :returns: wytrenowany klasyfikator
     """
+    import classifier
     train_set, eval_set = get_train_eval_sets(filename, partition)
     cl = classifier.get_trained_classifier(train_set)
     return cl
 
 
-def save_classifier(cl, filename="websites.txt", partition=1):
+def save_classifier(cl, filename="websites.txt", partition=1, training_state=True):
     """
-    Serializuje i zapisuje klasyfikator do pliku.
+    Zapisuje zwarty model do klasyfikacji oraz opcjonalnie serializuje pełny klasyfikator do pliku.
+
+    Pełny klasyfikator (z tekstami treningowymi) jest potrzebny tylko do douczania.
+    Zapisane wyniki klasyfikacji nie są usuwane - ich klucze zawierają wersję modelu, więc wyniki
+    poprzedniego modelu nie są już odczytywane i wygasają same.
 
     :param cl: klasyfikator
     :param filename: ścieżka do pliku z wpisami
     :param partition: float, część jaka ma znaleźć się w zbiorze treningowym
+    :param training_state: czy zapisać pełny klasyfikator
     """
+    try:
+        inference.save_inference_model(cl, get_model_dirname(filename, partition))
+    except ValueError as e:
+        print "Inference model not saved:", e
+        # poprzedni zwarty model nie może być dalej używany ani służyć jako wersja wyników
+        try:
+            os.remove(inference.get_current_path(get_model_dirname(filename, partition)))
+        except OSError:
+            pass
+    if not training_state:
+        return
     picklename = get_classifier_picklename(filename, partition)
-    with open(picklename, "w+b") as f:
+    tmpname = picklename + ".tmp"
+    with open(tmpname, "w+b") as f:
         pickle.dump(cl, f, pickle.HIGHEST_PROTOCOL)
+    # podmiana pliku jest atomowa, więc inne procesy nie odczytają niepełnego klasyfikatora
+    os.rename(tmpname, picklename)
+    # poprawki z dziennika są już zawarte w zapisanym klasyfikatorze
+    try:
+        os.remove(get_updates_filename(picklename))
+    except OSError:
+        pass
+    registry.put(picklename, cl)
 
 
 def load_classifier(filename, partition):
@@ -105,9 +315,32 @@ def load_classifier(filename, partition):
     :return klasyfkator
     """
     picklename = get_classifier_picklename(filename, partition)
+    return read_classifier(picklename)
+
+
+def read_classifier(picklename, stamp=None):
+    """
+    Odczytuje klasyfikator z podanego pliku i doucza go poprawkami z dziennika.
+
+    :param picklename: nazwa pliku klasyfikatora
+    :param stamp: znacznik wersji (get_model_stamp) - poprawki są odczytywane tylko do zapisanego w nim
+                  rozmiaru dziennika, domyślnie cały dziennik
+    :returns: klasyfikator
+    """
     with open(picklename, 'rb') as f:
         cl = pickle.load(f)
-        return cl
+    size = -1
+    if stamp is not None:
+        size = stamp[1][1] if stamp[1] is not None else 0
+    entries = read_updates(picklename, size)
+    # wpisy z tekstem wymagają tylko transformacji i partial_fit, bez ponownej ekstrakcji tekstu strony
+    texts_categories = dict((e['url'], (e['text'], e['category'])) for e in entries if 'text' in e)
+    if texts_categories:
+        cl.update_texts(texts_categories)
+    without_text = [e for e in entries if 'text' not in e]
+    if without_text:
+        cl.update(without_text)
+    return cl
 
 
 def get_classifier_picklename(filename, partition):
@@ -121,32 +354,121 @@ def get_classifier_picklename(filename, partition):
     return "cl_{}_{}_.pickle".format(filename, partition)
 
 
-def get_accuracy(partition, filename="websites.txt"):
+def get_model_dirname(filename, partition):
+    """
+    Zwraca nazwę katalogu zwartego modelu do klasyfikacji.
+
+    :param filename: ścieżka do pliku z wpisami
+    :param partition: float, część jaka ma znaleźć się w zbiorze treningowym
+    :returns: nazwa katalogu
+    """
+    return "cl_{}_{}_.model".format(filename, partition)
+
+
+def read_model(path, stamp=None):
+    """
+    Odczytuje klasyfikator lub zwarty model - w zależności od ścieżki.
+
+    :param path: plik klasyfikatora (.pickle) lub plik current.json katalogu zwartego modelu
+    :param stamp: znacznik wersji (get_model_stamp)
+    :returns: klasyfikator lub zwarty model
+    """
+    if path.endswith(".json"):
+        return inference.load_inference_model(path)
+    return read_classifier(path, stamp)
+
+
+def get_model_stamp(path):
+    """
+    Zwraca znacznik wersji klasyfikatora lub zwartego modelu. Znacznik klasyfikatora obejmuje też dziennik
+    poprawek, więc poprawka zapisana przez inny proces powoduje ponowne wczytanie klasyfikatora.
+
+    :param path: plik klasyfikatora (.pickle) lub plik current.json katalogu zwartego modelu
+    :returns: znacznik wersji
+    """
+    if path.endswith(".json"):
+        return get_file_stamp(path)
+    return get_file_stamp(path), get_file_stamp(get_updates_filename(path))
+
+
+registry = ModelRegistry(read_model, get_model_stamp)
+# wyniki są zapisywane na dysku, żeby kolejne wywołania cli.py mogły z nich korzystać
+result_cache = ResultCache(DiskBackend())
+
+
+def get_accuracy(partition, filename="websites.txt", processes=1):
     """
     Zwraca stosunek poprawnie przewidzianych wpisów do pełnej ich liczby.
 
     :param partition: float, część jaka ma znaleźć się w zbiorze treningowym
     :param filename: ścieżka do pliku z wpisami
+    :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
     :returns: poprawnie przewidziane/pełna liczba
     """
+    import classifier
     train, eval = get_train_eval_sets(filename, partition)
-    cl = classifier.get_trained_classifier(train)
-    return cl.accuracy(eval)
+    cl = classifier.get_trained_classifier(train, processes)
+    return cl.accuracy(eval, processes)
 
 
-def get_cross_val(folds, filename="websites.txt"):
+def get_cross_val(folds, filename="websites.txt", n_jobs=-1, processes=1):
     """
     Wykonuje walidację krzyżową z odpowiednią liczbą podzbiorów.
 
     :param folds: liczba podzbiorów na które zostanie podzielony zbiór wpisów
     :param filename: ścieżka do pliku z wpisamis
+    :param n_jobs: liczba procesów liczących podzbiory równolegle, -1 oznacza wszystkie rdzenie
+    :param processes: liczba procesów przetwarzających teksty, None oznacza wszystkie rdzenie
     :returns: wynik walidacji krzyżowej
     """
+    import classifier
     entries = datasource.get_raw_entries(filename)
     # random.seed(123)
     random.shuffle(entries)
     clf = classifier.get_classifier()
-    return clf.xval(entries, folds)
+    return clf.xval(entries, folds, n_jobs, processes)
+
+
+def get_sweep(folds, grid, filename="websites.txt", processes=1):
+    """
+    Sprawdza zestawy ustawień wektoryzatora i klasyfikatora walidacją krzyżową.
+
+    :param folds: liczba podzbiorów na które zostanie podzielony zbiór wpisów
+    :param grid: lista słowników z ustawieniami (patrz sweep.get_grid)
+    :param filename: ścieżka do pliku z wpisami
+    :param processes: liczba procesów, None oznacza wszystkie rdzenie
+    :returns: wyniki posortowane od najlepszego
+    """
+    import sweep
+    entries = datasource.get_raw_entries(filename)
+    random.shuffle(entries)
+    return sweep.sweep(entries, grid, folds, processes)
+
+
+def pull_websites(filename="websites.txt", force=False, workers=1, host_delay=1.0):
+    """
+    Pobiera strony z pliku z wpisami.
+
+    :param filename: ścieżka do pliku z wpisami
+    :param force: wymusza ponowne pobranie stron zapisanych na dysku
+    :param workers: liczba równoległych pobrań
+    :param host_delay: minimalny odstęp w sekundach między pobraniami z jednego hosta
+    :returns: lista adresów, których nie udało się pobrać
+    """
+    entries = datasource.get_raw_entries(filename)
+    return datasource.pull_websites(entries, force=force, workers=workers, host_delay=host_delay)
+
+
+def migrate_websites(filename="websites.txt", directory="websites/"):
+    """
+    Przenosi strony z wpisów ze starego katalogu websites/ do magazynu stron.
+
+    :param filename: ścieżka do pliku z wpisami
+    :param directory: katalog w starym układzie
+    :returns: liczba przeniesionych stron, lista plików, które nie odpowiadają żadnemu wpisowi
+    """
+    entries = datasource.get_raw_entries(filename)
+    return datasource.migrate_flat_layout(entries, directory)
 
 
 if __name__ == '__main__':
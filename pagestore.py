@@ -0,0 +1,231 @@
+# coding=utf-8
+from contextlib import contextmanager
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import time
+import urlparse
+
+
+class PageStore(object):
+    """
+    Magazyn kodów stron na dysku.
+
+    Strona jest zapisywana pod skrótem znormalizowanego adresu w dwupoziomowej strukturze katalogów
+    (ab/cd/abcd....html lub .html.gz), więc nazwy plików nie kolidują, a katalogi pozostają małe.
+    Obok strony zapisywany jest plik .json z metadanymi pobrania (adres, czas pobrania, rozmiar, skrót kodu, ETag,
+    Last-Modified).
+    """
+
+    def __init__(self, directory="pages/", compress=False):
+        """
+        Konstruktor.
+
+        :param directory: katalog magazynu
+        :param compress: czy kompresować zapisywane strony gzipem (takich stron nie da się mapować w pamięci)
+        """
+        self.directory = directory
+        self.compress = compress
+
+    def key(self, url):
+        """
+        Zwraca klucz strony.
+
+        :param url: pełny adres strony
+        :returns: skrót sha1 znormalizowanego adresu
+        """
+        return hashlib.sha1(normalize_url(url)).hexdigest()
+
+    def get_base_path(self, url):
+        """
+        Zwraca ścieżkę do plików strony bez rozszerzenia.
+
+        :param url: pełny adres strony
+        :returns: ścieżka
+        """
+        key = self.key(url)
+        return os.path.join(self.directory, key[:2], key[2:4], key)
+
+    def get_page_path(self, url):
+        """
+        Zwraca ścieżkę do istniejącego pliku strony - skompresowanego lub nie.
+
+        :param url: pełny adres strony
+        :returns: ścieżka lub None jeśli strona nie jest zapisana
+        """
+        base = self.get_base_path(url)
+        for path in (base + ".html.gz", base + ".html"):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def exists(self, url):
+        """
+        Sprawdza czy strona jest zapisana.
+
+        :param url: pełny adres strony
+        :returns: True jeśli strona jest zapisana
+        """
+        return self.get_page_path(url) is not None
+
+    def read(self, url):
+        """
+        Odczytuje kod strony.
+
+        :param url: pełny adres strony
+        :returns: html lub None jeśli strona nie jest zapisana
+        """
+        path = self.get_page_path(url)
+        if path is None:
+            return None
+        if path.endswith(".gz"):
+            with gzip.open(path, 'rb') as f:
+                return f.read()
+        with open(path, 'rb') as f:
+            return f.read()
+
+    @contextmanager
+    def open(self, url):
+        """
+        Udostępnia kod strony bez kopiowania go do pamięci procesu.
+
+        Niekompresowana strona jest mapowana w pamięci (mmap) - dane są odczytywane z pamięci podręcznej systemu
+        plików dopiero przy dostępie. Strona skompresowana jest rozpakowywana do bufora.
+        Bufor jest ważny tylko wewnątrz bloku with.
+
+        :param url: pełny adres strony
+        :returns: bufor z kodem strony (mmap lub str) lub None jeśli strona nie jest zapisana
+        """
+        path = self.get_page_path(url)
+        if path is None or path.endswith(".gz") or os.path.getsize(path) == 0:
+            yield self.read(url)
+            return
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield buf
+        finally:
+            buf.close()
+
+    def write(self, url, html, meta=None):
+        """
+        Zapisuje kod strony wraz z metadanymi.
+
+        :param url: pełny adres strony
+        :param html: kod strony
+        :param meta: dodatkowe metadane, np. nagłówki ETag/Last-Modified
+        """
+        base = self.get_base_path(url)
+        if not os.path.exists(os.path.dirname(base)):
+            try:
+                os.makedirs(os.path.dirname(base))
+            except OSError:
+                pass
+        path = base + (".html.gz" if self.compress else ".html")
+        tmpname = "{}.{}.tmp".format(path, os.getpid())
+        if self.compress:
+            with gzip.open(tmpname, 'wb') as f:
+                f.write(html)
+        else:
+            with open(tmpname, 'wb') as f:
+                f.write(html)
+        os.rename(tmpname, path)
+        for stale in (base + ".html.gz", base + ".html"):
+            if stale != path and os.path.exists(stale):
+                os.remove(stale)
+
+        page_meta = {'url': normalize_url(url), 'fetched_at': time.time(), 'size': len(html),
+                     'sha1': hashlib.sha1(html).hexdigest(), 'compressed': self.compress}
+        page_meta.update(meta or {})
+        self.write_meta(url, page_meta)
+
+    def read_meta(self, url):
+        """
+        Odczytuje metadane strony.
+
+        :param url: pełny adres strony
+        :returns: słownik z metadanymi, pusty jeśli nie zostały zapisane
+        """
+        try:
+            with open(self.get_base_path(url) + ".json", 'r') as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def write_meta(self, url, meta):
+        """
+        Zapisuje metadane strony.
+
+        :param url: pełny adres strony
+        :param meta: słownik z metadanymi
+        """
+        path = self.get_base_path(url) + ".json"
+        tmpname = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmpname, 'w') as f:
+            json.dump(meta, f)
+        os.rename(tmpname, path)
+
+    def version(self, url):
+        """
+        Zwraca identyfikator wersji strony bez czytania jej kodu - skrót zapisany w metadanych,
+        a dla stron zapisanych bez niego rozmiar i czas modyfikacji pliku.
+
+        :param url: pełny adres strony
+        :returns: identyfikator wersji lub None jeśli strona nie jest zapisana
+        """
+        sha1 = self.read_meta(url).get('sha1')
+        if sha1:
+            return sha1
+        path = self.get_page_path(url)
+        if path is None:
+            return None
+        st = os.stat(path)
+        return "{}:{}".format(st.st_size, st.st_mtime)
+
+    def update_meta(self, url, meta):
+        """
+        Uzupełnia metadane strony.
+
+        :param url: pełny adres strony
+        :param meta: słownik z nowymi wartościami
+        """
+        page_meta = self.read_meta(url)
+        page_meta.update(meta)
+        self.write_meta(url, page_meta)
+
+    def iter_urls(self):
+        """
+        Zwraca adresy wszystkich zapisanych stron.
+
+        :returns: generator adresów
+        """
+        if not os.path.exists(self.directory):
+            return
+        for root, dirs, names in os.walk(self.directory):
+            dirs.sort()
+            for name in sorted(names):
+                if name.endswith(".json"):
+                    with open(os.path.join(root, name), 'r') as f:
+                        yield json.load(f)['url']
+
+
+def normalize_url(url):
+    """
+    Normalizuje pełny adres strony: małe litery w schemacie i nazwie hosta, bez domyślnego portu i fragmentu,
+    pusta ścieżka zamieniona na "/".
+
+    :param url: pełny adres strony
+    :returns: znormalizowany adres
+    """
+    result = urlparse.urlsplit(url.strip())
+    scheme = result.scheme.lower()
+    netloc = result.netloc.lower()
+    if (scheme, netloc.rpartition(":")[2]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rpartition(":")[0]
+    path = result.path or "/"
+    normalized = urlparse.urlunsplit((scheme, netloc, path, result.query, ""))
+    if isinstance(normalized, unicode):
+        normalized = normalized.encode('utf-8')
+    return normalized
@@ -4,6 +4,7 @@
 import sys
 import getopt
 import optparse
+from collections import namedtuple
 
 def main(argv):
     parser = optparse.OptionParser()
@@ -27,6 +28,7 @@ def main(argv):
     print "ExpectedFile:", expected_stem_location
     expected = None
     lines_parsed = 0
+    stemmer = Stemmer()
     if black_list_file_location:
         blacklist = get_blacklist(black_list_file_location)
     if evaluate:
@@ -65,14 +67,7 @@ def main(argv):
                     else:
                         print word,
                     """
-                stem = word[:]
-                stem = remove_nouns(stem)
-                stem = remove_diminutive(stem)
-                stem = remove_adjective_ends(stem)
-                stem = remove_verbs_ends(stem)
-                stem = remove_adverbs_ends(stem)
-                stem = remove_plural_forms(stem)
-                stem = remove_general_ends(stem)
+                stem = stemmer.stem(word)
                 if blacklisted:
                     stem = word[:]
                 #print stem
@@ -134,14 +129,7 @@ def main(argv):
                     else:
                         print word,
                     """
-                stem = word[:]
-                stem = remove_nouns(stem)
-                stem = remove_diminutive(stem)
-                stem = remove_adjective_ends(stem)
-                stem = remove_verbs_ends(stem)
-                stem = remove_adverbs_ends(stem)
-                stem = remove_plural_forms(stem)
-                stem = remove_general_ends(stem)
+                stem = stemmer.stem(word)
                 if blacklisted:
                     stem = word[:]
                 #print stem
@@ -164,82 +152,189 @@ def get_blacklist(location):
         blacklist_list.append(line.decode('utf-8').strip(' \t\n\r'))
     return blacklist_list
     
+# Rule(min_len, suffixes, cut, start, prefixes, max_len): if len(word) > min_len
+# (and <= max_len), the word starts with one of the prefixes and ends with one
+# of the suffixes, the stem is word[start:len(word) - cut].
+# Within a step the first matching rule wins.
+Rule = namedtuple('Rule', 'min_len suffixes cut start prefixes max_len')
+
+
+def rule(min_len, suffixes, cut, start=0, prefixes=(), max_len=None):
+    return Rule(min_len, tuple(suffixes), cut, start, tuple(prefixes), max_len)
+
+
+GENERAL_ENDS = [
+    rule(4, [u"ia", u"ie"], 2),
+    rule(4, [u"u", u"ą", u"i", u"a", u"ę", u"y", u"ł"], 1),
+]
+
+DIMINUTIVE = [
+    rule(6, [u"eczek", u"iczek", u"iszek", u"aszek", u"uszek"], 5),
+    rule(6, [u"enek", u"ejek", u"erek"], 2),
+    rule(4, [u"ek", u"ak"], 2),
+]
+
+VERBS_ENDS = [
+    rule(5, [u"bym"], 3),
+    rule(5, [u"esz", u"asz", u"cie", u"eść", u"aść", u"łem", u"amy", u"emy"], 3),
+    rule(3, [u"esz", u"asz", u"eść", u"aść"], 2),
+    rule(3, [u"ać", u"em", u"am", u"ał", u"ił", u"ić", u"ąc"], 2),
+]
+
+NOUNS = [
+    rule(7, [u"zacja", u"zacją", u"zacji"], 4),
+    rule(6, [u"acja", u"acji", u"acją", u"tach", u"anie", u"enie", u"eniu", u"aniu"], 4),
+    rule(6, [u"tyka"], 2),
+    rule(5, [u"ach", u"ami", u"nia", u"niu", u"cia", u"ciu"], 3),
+    rule(5, [u"cji", u"cja", u"cją"], 2),
+    rule(5, [u"ce", u"ta"], 2),
+]
+
+ADJECTIVE_ENDS = [
+    rule(7, [u"sze", u"szy"], 3, start=3, prefixes=[u"naj"]),
+    rule(7, [u"szych"], 5, start=3, prefixes=[u"naj"]),
+    rule(6, [u"czny"], 4),
+    rule(5, [u"owy", u"owa", u"owe", u"ych", u"ego"], 3),
+    rule(5, [u"ej"], 2),
+]
+
+ADVERBS_ENDS = [
+    # six-letter words starting with "nie"/"wie"
+    rule(5, [], 2, prefixes=[u"nie", u"wie"], max_len=6),
+    rule(4, [u"rze"], 2),
+]
+
+PLURAL_FORMS = [
+    rule(4, [u"ów", u"om"], 2),
+    rule(4, [u"ami"], 3),
+]
+
+
+class StemmingStep(object):
+    """
+    One step of the stemmer compiled into suffix lookup tables.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        tables = {}
+        self.free = []
+        for i, r in enumerate(rules):
+            if not r.suffixes:
+                self.free.append(i)
+            for suffix in r.suffixes:
+                tables.setdefault(len(suffix), {}).setdefault(suffix, []).append(i)
+        self.tables = sorted(tables.items(), reverse=True)
+
+    def matches(self, word, i):
+        r = self.rules[i]
+        n = len(word)
+        if n <= r.min_len or (r.max_len is not None and n > r.max_len):
+            return False
+        return not r.prefixes or any(word.startswith(p) for p in r.prefixes)
+
+    def apply(self, word):
+        n = len(word)
+        best = None
+        for length, table in self.tables:
+            if n < length:
+                continue
+            for i in table.get(word[-length:], ()):
+                if best is not None and i > best:
+                    break
+                if self.matches(word, i):
+                    best = i
+                    break
+        for i in self.free:
+            if best is not None and i > best:
+                break
+            if self.matches(word, i):
+                best = i
+                break
+        if best is None:
+            return word
+        r = self.rules[best]
+        return word[r.start:n - r.cut]
+
+
+general_ends_step = StemmingStep(GENERAL_ENDS)
+diminutive_step = StemmingStep(DIMINUTIVE)
+verbs_ends_step = StemmingStep(VERBS_ENDS)
+nouns_step = StemmingStep(NOUNS)
+adjective_ends_step = StemmingStep(ADJECTIVE_ENDS)
+adverbs_ends_step = StemmingStep(ADVERBS_ENDS)
+plural_forms_step = StemmingStep(PLURAL_FORMS)
+
+# order used by the command line tool
+DEFAULT_STEPS = [nouns_step, diminutive_step, adjective_ends_step, verbs_ends_step,
+                 adverbs_ends_step, plural_forms_step, general_ends_step]
+
+
+class Stemmer(object):
+    """
+    Stemmer applying the steps in order, with a bounded memo of word -> stem.
+
+    The memo keeps two generations: when the current one is full it becomes
+    the old one, and words found in the old generation are moved back, so
+    frequently used words stay cached (approximate LRU).
+    """
+
+    def __init__(self, steps=DEFAULT_STEPS, memo_size=100000):
+        self.steps = steps
+        self.memo_size = memo_size
+        self.memo = {}
+        self.old_memo = {}
+
+    def stem_uncached(self, word):
+        for step in self.steps:
+            word = step.apply(word)
+        return word
+
+    def stem(self, word):
+        try:
+            return self.memo[word]
+        except KeyError:
+            pass
+        stem = self.old_memo.get(word)
+        if stem is None:
+            stem = self.stem_uncached(word)
+        if len(self.memo) >= self.memo_size:
+            self.old_memo = self.memo
+            self.memo = {}
+        self.memo[word] = stem
+        return stem
+
+    __call__ = stem
+
+
 def remove_general_ends(word):
-    #print "DEBUG: END", word[-1:]
-    if len(word) > 4 and word[-2:] in {"ia", "ie"}:
-        return word[:-2]
-    if len(word) > 4 and word[-1:] in {"u", u"ą", "i", "a", u"ę", "y", u"ę", u"ł"}:
-        return word[:-1]
-    return word
-    
+    return general_ends_step.apply(word)
+
+
 def remove_diminutive(word):
-    if len(word) > 6:
-        if word[-5:] in {"eczek", "iczek", "iszek", "aszek", "uszek"}:
-            return word[:-5]
-        if word[-4:] in {"enek", "ejek", "erek"}:
-            return word[:-2]
-    if len(word) > 4:
-        if word[-2:] in {"ek", "ak"}:
-            return word[:-2]
-    return word
-    
+    return diminutive_step.apply(word)
+
+
 def remove_verbs_ends(word):
-    if len(word) > 5 and word.endswith("bym"):
-        return word[:-3]
-    if len(word) > 5 and word[-3:] in {"esz", "asz", "cie", u"eść", u"aść", u"łem", "amy", "emy"}:
-        return word[:-3]
-    if len(word) > 3 and word[-3:] in {"esz", "asz", u"eść", u"aść", u"eć", u"ać"}:
-        return word[:-2]
-    if len(word) > 3 and word[-3:] in {"aj"}:
-        return word[:-1]
-    if len(word) > 3 and word[-2:] in {u"ać", "em", "am", u"ał", u"ił", u"ić", u"ąc"}:
-        return word[:-2]
-    return word
+    return verbs_ends_step.apply(word)
+
 
 def remove_nouns(word):
-    if len(word) > 7 and word[-5:] in {"zacja", u"zacją", "zacji"}:
-        return word[:-4]
-    if len(word) > 6 and word[-4:] in {"acja", "acji", u"acją", "tach", "anie", "enie",
-    "eniu", "aniu"}:
-        return word[:-4]
-    if len(word) > 6 and word.endswith("tyka"):
-        return word[:-2]
-    if len(word) > 5 and word[-3:] in {"ach", "ami", "nia", "niu", "cia", "ciu"}:
-        return word[:-3]
-    if len(word) > 5 and word[-3:] in {"cji", "cja", u"cją"}:
-        return word[:-2]
-    if len(word) > 5 and word[-2:] in {"ce", "ta"}:
-        return word[:-2]
-    return word
-    
+    return nouns_step.apply(word)
+
+
 def remove_adjective_ends(word):
-    if len(word) > 7 and word.startswith("naj") and (word.endswith("sze")
-    or word.endswith("szy")):
-        return word[3:-3]
-    if len(word) > 7 and word.startswith("naj") and word.endswith("szych"):
-        return word[3:-5]
-    if len(word) > 6 and word.endswith("czny"):
-        return word[:-4]
-    if len(word) > 5 and word[-3:] in {"owy", "owa", "owe", "ych", "ego"}:
-        return word[:-3]
-    if len(word) > 5 and word[-2:] in {"ej"}:
-        return word[:-2]
-    return word
-    
+    return adjective_ends_step.apply(word)
+
+
 def remove_adverbs_ends(word):
-    if len(word) > 4 and word[:-3] in {"nie", "wie"}:
-        return word[:-2]
-    if len(word) > 4 and word.endswith("rze"):
-        return word[:-2]
-    return word
+    return adverbs_ends_step.apply(word)
+
 
 def remove_plural_forms(word):
-    if len(word) > 4 and (word.endswith(u"ów") or word.endswith("om")):
-        return word[:-2]
-    if len(word) > 4 and word.endswith("ami"):
-        return word[:-3]
-    return word
-    
+    return plural_forms_step.apply(word)
+
+
 def is_in_blacklist(word, blacklist):
     if word in blacklist:
         return True
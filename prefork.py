@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# coding=utf-8
+import argparse
+import multiprocessing
+import os
+import signal
+from SocketServer import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, make_server
+
+import datasource
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    """
+    Serwer WSGI obsługujący każde żądanie w osobnym wątku.
+    """
+    daemon_threads = True
+
+
+def preload(filename):
+    """
+    Wczytuje model i moduły przed utworzeniem procesów roboczych, żeby ich pamięć była współdzielona.
+
+    Tablice zwartego modelu są mapowane z pliku tylko do odczytu, więc procesy robocze korzystają z tych samych
+    stron pamięci podręcznej systemu plików, niezależnie od rozmiaru modelu.
+
+    :param filename: plik z wpisami treningowymi
+    """
+    import htmlparser
+    import main
+    main.get_inference_model(filename)
+    htmlparser.get_stopwords()
+    htmlparser.parse_html("<html></html>")
+
+
+def stop(signum, frame):
+    """
+    Obsługa sygnału SIGTERM - kończy pętlę serwera.
+
+    :param signum: numer sygnału
+    :param frame: bieżąca ramka stosu
+    """
+    raise SystemExit
+
+
+def spawn_worker(server):
+    """
+    Tworzy proces roboczy obsługujący żądania na wspólnym gnieździe serwera.
+
+    :param server: serwer WSGI z otwartym gniazdem
+    :returns: pid procesu roboczego
+    """
+    pid = os.fork()
+    if pid:
+        return pid
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        datasource.browser_pool.close()
+        os._exit(0)
+
+
+def serve(app, host="0.0.0.0", port=8080, workers=None):
+    """
+    Serwuje aplikację WSGI w kilku procesach roboczych współdzielących jedno gniazdo.
+    Proces nadrzędny tylko pilnuje procesów roboczych i uruchamia ponownie te, które się zakończyły.
+
+    :param app: aplikacja WSGI
+    :param host: adres, na którym serwer nasłuchuje
+    :param port: port
+    :param workers: liczba procesów roboczych, domyślnie liczba rdzeni
+    """
+    server = make_server(host, port, app, ThreadingWSGIServer)
+    workers = workers or multiprocessing.cpu_count()
+    children = set(spawn_worker(server) for i in xrange(workers))
+    print "Serving on {}:{} with {} workers".format(host, port, workers)
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        while True:
+            pid, status = os.wait()
+            if pid in children:
+                children.remove(pid)
+                print "Worker {} exited, restarting".format(pid)
+                children.add(spawn_worker(server))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        server.server_close()
+
+
+def get_parser():
+    """
+    Tworzy parser parametrów z linii komend.
+
+    :return: obiekt parsera
+    """
+    parser = argparse.ArgumentParser(description='Website classificator pre-fork REST server')
+    parser.add_argument('-w', '--workers', type=int, default=None)
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('-p', '--port', type=int, default=8080)
+    return parser
+
+
+if __name__ == '__main__':
+    args = get_parser().parse_args()
+    import rest
+    preload(rest.FILENAME)
+    serve(rest.app.wsgifunc(), args.host, args.port, args.workers)
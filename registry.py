@@ -0,0 +1,74 @@
+# coding=utf-8
+import os
+import threading
+
+
+class ModelRegistry(object):
+    """
+    Rejestr klasyfikatorów trzymanych w pamięci procesu.
+
+    Klasyfikator jest odczytywany z dysku tylko raz, a kolejne żądania dostają obiekt z pamięci.
+    Jeśli zmieni się znacznik wersji pliku (np. plik podmieni inny proces), obiekt jest wczytywany ponownie.
+    """
+
+    def __init__(self, loader, stamp=None):
+        """
+        Konstruktor.
+
+        :param loader: funkcja przyjmująca ścieżkę do pliku i znacznik jego wersji, zwracająca klasyfikator
+        :param stamp: funkcja zwracająca znacznik wersji pliku, domyślnie get_file_stamp
+        """
+        self.loader = loader
+        self.stamp = stamp or get_file_stamp
+        self.lock = threading.Lock()
+        self.models = {}
+
+    def get(self, path):
+        """
+        Zwraca klasyfikator z pamięci, wczytując go z dysku przy pierwszym użyciu lub po zmianie pliku.
+
+        :param path: ścieżka do pliku klasyfikatora
+        :returns: klasyfikator
+        """
+        stamp = self.stamp(path)
+        entry = self.models.get(path)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        with self.lock:
+            entry = self.models.get(path)
+            if entry is not None and entry[0] == stamp:
+                return entry[1]
+            model = self.loader(path, stamp)
+            self.models[path] = (stamp, model)
+            return model
+
+    def put(self, path, model):
+        """
+        Podmienia klasyfikator w pamięci na nowo zapisany.
+
+        :param path: ścieżka do pliku klasyfikatora
+        :param model: klasyfikator
+        """
+        with self.lock:
+            self.models[path] = (self.stamp(path), model)
+
+    def clear(self):
+        """
+        Usuwa wszystkie klasyfikatory z pamięci.
+        """
+        with self.lock:
+            self.models.clear()
+
+
+def get_file_stamp(path):
+    """
+    Zwraca znacznik wersji pliku - zmienia się przy każdej podmianie pliku.
+
+    :param path: ścieżka do pliku
+    :returns: krotka (i-węzeł, rozmiar, czas modyfikacji) lub None jeśli plik nie istnieje
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime
@@ -1,18 +1,69 @@
 #!/usr/bin/env python
 # coding=utf-8
+import threading
 import urllib
 import web
 import json
+import datasource
 import main
+from resultcache import MemoryBackend, ResultCache
+from serving import BatchingPredictor, ClassificationService, ServiceBusy, ServiceTimeout
 
 urls = (
     '/classify/(.*)', 'classify',
     '/classify', 'classify'
 )
 
+# plik z wpisami treningowymi klasyfikatora
+FILENAME = "websites.txt"
+# liczba stron pobieranych i klasyfikowanych równolegle
+WORKERS = 8
+# maksymalna liczba różnych stron klasyfikowanych lub czekających w kolejce
+MAX_PENDING = 64
+# czas oczekiwania na wynik klasyfikacji w sekundach
+TIMEOUT = 30
+# maksymalny czas dobierania żądań do wspólnej partii przewidywań w sekundach
+MAX_WAIT = 0.005
+# maksymalna liczba stron w partii przewidywań
+MAX_BATCH = 32
+
 app = web.application(urls, globals())
 
 
+def classify_website(url):
+    """
+    Klasyfikuje stronę klasyfikatorem nauczonym na domyślnym pliku z wpisami.
+
+    :param url: adres strony
+    :returns: przewidziana kategoria
+    """
+    return main.classify_website(url, FILENAME, False, predictor)
+
+
+predictor = None
+service = None
+service_lock = threading.Lock()
+
+
+def get_service():
+    """
+    Zwraca serwis klasyfikacji. Serwis i jego wątki są tworzone przy pierwszym żądaniu,
+    więc przy serwowaniu w wielu procesach (prefork.py) powstają dopiero w procesie roboczym.
+    Wtedy też pula przeglądarek procesu jest powiększana, żeby każdy wątek serwisu mógł pobierać
+    stronę własną przeglądarką.
+
+    :returns: ClassificationService
+    """
+    global predictor, service
+    if service is None:
+        with service_lock:
+            if service is None:
+                datasource.browser_pool.resize(WORKERS)
+                predictor = BatchingPredictor(MAX_WAIT, MAX_BATCH)
+                service = ClassificationService(classify_website, WORKERS, MAX_PENDING, TIMEOUT)
+    return service
+
+
 class classify:
 
     def GET(self, url):
@@ -23,7 +74,12 @@ class classify:
         :returns: json z odpowiedzią
         """
         url = urllib.unquote(url)
-        resp = main.classify_website(url, "websites.txt", False)
+        try:
+            resp = get_service().classify(url)
+        except ServiceBusy:
+            raise web.HTTPError("503 Service Unavailable", data=json.dumps("Too many pending requests"))
+        except ServiceTimeout:
+            raise web.HTTPError("504 Gateway Timeout", data=json.dumps("Classification still running"))
         return json.dumps(resp)
 
     def POST(self):
@@ -40,4 +96,8 @@ class classify:
         return resp
 
 if __name__ == "__main__":
+    # klasyfikator jest wczytywany raz przy starcie i trzymany w pamięci
+    main.get_inference_model(FILENAME)
+    # proces serwera działa długo, więc wyniki są trzymane w jego pamięci
+    main.result_cache = ResultCache(MemoryBackend())
     app.run()
@@ -0,0 +1,263 @@
+# coding=utf-8
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import threading
+import time
+
+import datasource
+from pagestore import normalize_url
+
+
+class MemoryBackend(object):
+    """
+    Pamięć podręczna w pamięci procesu. Po przekroczeniu maksymalnej liczby wpisów
+    usuwane są najdawniej używane.
+    """
+
+    def __init__(self, max_entries=10000):
+        """
+        Konstruktor.
+
+        :param max_entries: maksymalna liczba wpisów
+        """
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Odczytuje wpis i oznacza go jako ostatnio używany.
+
+        :param key: klucz wpisu
+        :returns: krotka (wartość, czas wygaśnięcia) lub None jeśli nie ma wpisu
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is not None:
+                self.entries[key] = entry
+            return entry
+
+    def set(self, key, value, expires):
+        """
+        Zapisuje wpis.
+
+        :param key: klucz wpisu
+        :param value: wartość
+        :param expires: czas wygaśnięcia (time.time())
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = (value, expires)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Usuwa wpis.
+
+        :param key: klucz wpisu
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """
+        Usuwa wszystkie wpisy.
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+class DiskBackend(object):
+    """
+    Pamięć podręczna na dysku, współdzielona przez procesy (np. kolejne wywołania cli.py).
+    Każdy wpis to mały plik .json. Po przekroczeniu maksymalnej liczby wpisów
+    usuwane są najdawniej używane.
+    """
+
+    def __init__(self, directory="cache/results/", max_entries=100000):
+        """
+        Konstruktor.
+
+        :param directory: katalog z wpisami
+        :param max_entries: maksymalna liczba wpisów
+        """
+        self.directory = directory
+        self.max_entries = max_entries
+        self.count = None
+        self.lock = threading.Lock()
+
+    def get_path(self, key):
+        """
+        Zwraca ścieżkę do pliku wpisu.
+
+        :param key: klucz wpisu
+        :returns: ścieżka
+        """
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        """
+        Odczytuje wpis i oznacza go jako ostatnio używany.
+
+        :param key: klucz wpisu
+        :returns: krotka (wartość, czas wygaśnięcia) lub None jeśli nie ma wpisu
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+        try:
+            # czas modyfikacji służy jako czas ostatniego użycia
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry['value'], entry['expires']
+
+    def set(self, key, value, expires):
+        """
+        Zapisuje wpis.
+
+        :param key: klucz wpisu
+        :param value: wartość (musi dać się zapisać jako json)
+        :param expires: czas wygaśnięcia (time.time())
+        """
+        path = self.get_path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        tmpname = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmpname, 'w') as f:
+            json.dump({'value': value, 'expires': expires}, f)
+        os.rename(tmpname, path)
+
+        with self.lock:
+            if self.count is None:
+                self.count = len(self.get_files())
+            else:
+                self.count += 1
+            if self.count > self.max_entries:
+                self.evict()
+
+    def delete(self, key):
+        """
+        Usuwa wpis.
+
+        :param key: klucz wpisu
+        """
+        try:
+            os.remove(self.get_path(key))
+        except OSError:
+            pass
+
+    def get_files(self):
+        """
+        Zwraca listę plików wpisów.
+
+        :returns: lista krotek (czas ostatniego użycia, ścieżka)
+        """
+        files = []
+        if not os.path.exists(self.directory):
+            return files
+        for root, dirs, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    files.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        return files
+
+    def evict(self):
+        """
+        Usuwa najdawniej używane wpisy, aż ich liczba spadnie do 90% maksymalnej.
+        """
+        files = sorted(self.get_files())
+        remove = max(0, len(files) - int(self.max_entries * 0.9))
+        for mtime, path in files[:remove]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.count = len(files) - remove
+
+    def clear(self):
+        """
+        Usuwa wszystkie wpisy.
+        """
+        with self.lock:
+            for mtime, path in self.get_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.count = 0
+
+
+class ResultCache(object):
+    """
+    Pamięć podręczna wyników klasyfikacji.
+
+    Kluczem jest znormalizowany adres strony i wersja modelu, więc zapisanie nowego modelu
+    (douczenie lub ponowne uczenie) automatycznie unieważnia stare wyniki. Wynik wygasa po czasie ttl.
+    """
+
+    def __init__(self, backend=None, ttl=3600):
+        """
+        Konstruktor.
+
+        :param backend: MemoryBackend (domyślnie) lub DiskBackend
+        :param ttl: czas ważności wyniku w sekundach
+        """
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+
+    def key(self, url, version):
+        """
+        Zwraca klucz wpisu.
+
+        :param url: adres strony
+        :param version: wersja modelu
+        :returns: skrót sha1
+        """
+        return hashlib.sha1("{}|{}".format(normalize_url(datasource.get_full_url(url)), version)).hexdigest()
+
+    def get(self, url, version):
+        """
+        Odczytuje wynik klasyfikacji.
+
+        :param url: adres strony
+        :param version: wersja modelu
+        :returns: wynik lub None jeśli nie ma ważnego wpisu
+        """
+        key = self.key(url, version)
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires < time.time():
+            self.backend.delete(key)
+            return None
+        return value
+
+    def put(self, url, version, result):
+        """
+        Zapisuje wynik klasyfikacji.
+
+        :param url: adres strony
+        :param version: wersja modelu
+        :param result: wynik klasyfikacji
+        """
+        self.backend.set(self.key(url, version), result, time.time() + self.ttl)
+
+    def clear(self):
+        """
+        Usuwa wszystkie wyniki.
+        """
+        self.backend.clear()
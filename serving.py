@@ -0,0 +1,234 @@
+# coding=utf-8
+import Queue
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+
+import datasource
+import htmlparser
+from pagestore import normalize_url
+
+
+class ServiceBusy(Exception):
+    """
+    Zbyt wiele stron jest jednocześnie klasyfikowanych.
+    """
+
+
+class ServiceTimeout(Exception):
+    """
+    Klasyfikacja nie zakończyła się w wyznaczonym czasie. Trwa dalej w tle.
+    """
+
+
+class ClassificationService(object):
+    """
+    Wykonuje klasyfikację stron (pobieranie, ekstrakcję i predykcję) w puli wątków.
+
+    Równoczesne żądania dotyczące tej samej strony są łączone - strona jest pobierana i klasyfikowana raz,
+    a wszyscy czekający dostają ten sam wynik. Liczba różnych klasyfikowanych naraz stron jest ograniczona,
+    a czekający na wynik dostaje ServiceTimeout po przekroczeniu limitu czasu (klasyfikacja kończy się w tle,
+    więc wynik trafia do pamięci podręcznej).
+    """
+
+    def __init__(self, classify, workers=8, max_pending=64, timeout=30):
+        """
+        Konstruktor.
+
+        :param classify: funkcja klasyfikująca jedną stronę, przyjmuje adres strony
+        :param workers: liczba wątków wykonujących klasyfikację
+        :param max_pending: maksymalna liczba różnych stron klasyfikowanych lub czekających w kolejce
+        :param timeout: domyślny czas oczekiwania na wynik w sekundach
+        """
+        self.classify_url = classify
+        self.workers = workers
+        self.timeout = timeout
+        self.pool = ThreadPool(workers)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+
+    def submit(self, url):
+        """
+        Zleca klasyfikację strony lub dołącza do trwającej klasyfikacji tej samej strony.
+
+        :param url: adres strony
+        :returns: AsyncResult z wynikiem klasyfikacji
+        :raises ServiceBusy: jeśli osiągnięto limit klasyfikowanych stron
+        """
+        key = normalize_url(datasource.get_full_url(url))
+        with self.lock:
+            result = self.in_flight.get(key)
+            if result is None:
+                if not self.slots.acquire(False):
+                    raise ServiceBusy("Too many pending classifications")
+                result = self.pool.apply_async(self.run, (key, url))
+                self.in_flight[key] = result
+        return result
+
+    def run(self, key, url):
+        """
+        Klasyfikuje stronę w wątku puli i zwalnia jej miejsce.
+
+        :param key: znormalizowany adres strony
+        :param url: adres strony
+        :returns: wynik klasyfikacji
+        """
+        try:
+            return self.classify_url(url)
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+            self.slots.release()
+
+    def classify(self, url, timeout=None):
+        """
+        Klasyfikuje stronę, czekając na wynik co najwyżej timeout sekund.
+
+        :param url: adres strony
+        :param timeout: czas oczekiwania w sekundach, domyślnie ustawiony w konstruktorze
+        :returns: wynik klasyfikacji
+        :raises ServiceBusy: jeśli osiągnięto limit klasyfikowanych stron
+        :raises ServiceTimeout: jeśli wynik nie był gotowy w wyznaczonym czasie
+        """
+        result = self.submit(url)
+        try:
+            return result.get(timeout if timeout is not None else self.timeout)
+        except multiprocessing.TimeoutError:
+            raise ServiceTimeout("Classification of {} is still running".format(url))
+
+    def close(self):
+        """
+        Kończy pracę puli wątków po wykonaniu zleconych klasyfikacji.
+        """
+        self.pool.close()
+        self.pool.join()
+
+
+class BatchingPredictor(object):
+    """
+    Łączy przewidywania z równoległych żądań w partie - jedna macierz cech i jedno wywołanie predict na partię.
+
+    Wątek predyktora bierze pierwsze oczekujące żądanie i dobiera kolejne przez co najwyżej max_wait sekund
+    lub do max_batch żądań. Nie czeka, jeśli żadne inne żądanie nie jest w trakcie ekstrakcji tekstu,
+    więc pojedyncze żądanie nie jest opóźniane.
+    """
+
+    def __init__(self, max_wait=0.005, max_batch=32):
+        """
+        Konstruktor.
+
+        :param max_wait: maksymalny czas dobierania żądań do partii w sekundach
+        :param max_batch: maksymalna liczba tekstów w partii
+        """
+        self.max_wait = max_wait
+        self.max_batch = max_batch
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.active = 0
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def classify(self, model, url):
+        """
+        Klasyfikuje stronę - tekst jest wyciągany w wątku wołającym, a przewidywanie wykonywane w partii.
+
+        :param model: model z metodą predict_texts (InferenceModel lub CategoryClassifier)
+        :param url: adres strony
+        :returns: wynik klasyfikacji
+        """
+        self.enter()
+        try:
+            return self.submit(model, htmlparser.get_filtered_tokens(url))
+        finally:
+            self.leave()
+
+    def predict(self, model, text):
+        """
+        Klasyfikuje przefiltrowany tekst strony w partii z innymi żądaniami.
+
+        :param model: model z metodą predict_texts
+        :param text: przefiltrowany tekst strony lub lista jego tokenów
+        :returns: wynik klasyfikacji
+        """
+        self.enter()
+        try:
+            return self.submit(model, text)
+        finally:
+            self.leave()
+
+    def enter(self):
+        """
+        Oznacza rozpoczęcie obsługi żądania.
+        """
+        with self.lock:
+            self.active += 1
+
+    def leave(self):
+        """
+        Oznacza zakończenie obsługi żądania.
+        """
+        with self.lock:
+            self.active -= 1
+
+    def submit(self, model, text):
+        """
+        Przekazuje tekst do wątku predyktora i czeka na wynik.
+
+        :param model: model z metodą predict_texts
+        :param text: przefiltrowany tekst strony lub lista jego tokenów
+        :returns: wynik klasyfikacji
+        """
+        request = {'model': model, 'text': text, 'done': threading.Event()}
+        self.queue.put(request)
+        request['done'].wait()
+        if 'error' in request:
+            raise request['error']
+        return request['result']
+
+    def get_batch(self):
+        """
+        Czeka na pierwsze żądanie i dobiera kolejne do partii.
+
+        :returns: lista żądań
+        """
+        batch = [self.queue.get()]
+        deadline = time.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except Queue.Empty:
+                pass
+            remaining = deadline - time.time()
+            if remaining <= 0 or self.active <= len(batch):
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except Queue.Empty:
+                break
+        return batch
+
+    def run(self):
+        """
+        Pętla wątku predyktora.
+        """
+        while True:
+            batch = self.get_batch()
+            models = []
+            for request in batch:
+                if request['model'] not in models:
+                    models.append(request['model'])
+            for model in models:
+                group = [request for request in batch if request['model'] is model]
+                try:
+                    results = model.predict_texts([request['text'] for request in group])
+                    for request, result in zip(group, results):
+                        request['result'] = result
+                except Exception as e:
+                    for request in group:
+                        request['error'] = e
+                for request in group:
+                    request['done'].set()
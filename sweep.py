@@ -0,0 +1,117 @@
+# coding=utf-8
+import itertools
+import multiprocessing
+import time
+
+import numpy as np
+from sklearn import cross_validation
+from sklearn.linear_model import SGDClassifier
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.svm import LinearSVC
+
+import classifier
+
+CLASSIFIERS = {
+    'sgd': SGDClassifier,
+    'linearsvc': LinearSVC,
+    'nb': MultinomialNB,
+}
+
+# macierze liczności współdzielone z procesami roboczymi: (ngram_range, stemming) -> (macierz, kategorie)
+matrices = {}
+
+
+def get_grid(max_features, ngram_ranges, stemmings, classifiers):
+    """
+    Zwraca listę wszystkich kombinacji ustawień.
+
+    :param max_features: lista liczb cech
+    :param ngram_ranges: lista zakresów n-gramów
+    :param stemmings: lista flag stemmingu
+    :param classifiers: lista nazw klasyfikatorów (klucze CLASSIFIERS)
+    :returns: lista słowników z ustawieniami
+    """
+    return [{'max_features': m, 'ngram_range': n, 'stemming': s, 'clf': c}
+            for m, n, s, c in itertools.product(max_features, ngram_ranges, stemmings, classifiers)]
+
+
+def evaluate(config, folds):
+    """
+    Liczy walidację krzyżową jednego zestawu ustawień na macierzy liczności z pamięci procesu.
+
+    :param config: słownik z ustawieniami
+    :param folds: liczba podzbiorów
+    :returns: słownik z ustawieniami, wynikiem oraz średnim czasem uczenia i klasyfikacji podzbioru
+    """
+    matrix, categories = matrices[(config['ngram_range'], config['stemming'])]
+    categories = np.asarray(categories)
+    pipeline = classifier.get_pipeline(CLASSIFIERS[config['clf']](), config['max_features'])
+    scores = []
+    train_time = 0
+    predict_time = 0
+    for train, test in cross_validation.StratifiedKFold(categories, n_folds=folds):
+        start = time.time()
+        pipeline.fit(matrix[train], categories[train])
+        train_time += time.time() - start
+        start = time.time()
+        predicted = pipeline.predict(matrix[test])
+        predict_time += time.time() - start
+        scores.append(np.mean(predicted == categories[test]))
+    result = dict(config)
+    result.update({'score': np.mean(scores), 'train_time': train_time / folds, 'predict_time': predict_time / folds})
+    return result
+
+
+def evaluate_args(args):
+    """
+    Wywołuje evaluate z krotki argumentów (dla Pool.imap_unordered).
+
+    :param args: krotka (ustawienia, liczba podzbiorów)
+    :returns: wynik evaluate
+    """
+    return evaluate(*args)
+
+
+def sweep(entries, grid, folds, processes=1):
+    """
+    Sprawdza wszystkie zestawy ustawień walidacją krzyżową w puli procesów.
+
+    Macierze liczności są liczone (lub odczytywane z pamięci podręcznej) raz dla każdej kombinacji
+    n-gramów i stemmingu i współdzielone z procesami roboczymi.
+
+    :param entries: wpisy - lista słowników zawierających url i kategorię
+    :param grid: lista słowników z ustawieniami
+    :param folds: liczba podzbiorów
+    :param processes: liczba procesów, None oznacza wszystkie rdzenie
+    :returns: lista wyników posortowana od najlepszego wyniku, przy równych wynikach od najszybszego
+    """
+    for config in grid:
+        key = (config['ngram_range'], config['stemming'])
+        if key not in matrices:
+            matrices[key] = classifier.get_count_matrix(entries, *key, processes=processes)
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = list(pool.imap_unordered(evaluate_args, [(config, folds) for config in grid]))
+    finally:
+        pool.close()
+        pool.join()
+    results.sort(key=lambda r: (-r['score'], r['train_time'] + r['predict_time']))
+    return results
+
+
+def format_results(results):
+    """
+    Formatuje wyniki jako tabelę z pozycją według wyniku i według czasu.
+
+    :param results: lista wyników posortowana według wyniku
+    :returns: tekst tabeli
+    """
+    by_time = sorted(results, key=lambda r: r['train_time'] + r['predict_time'])
+    time_rank = dict((id(r), i) for i, r in enumerate(by_time, 1))
+    lines = ["rank time_rank score  train_s  predict_s clf        max_features ngram stemming"]
+    for i, r in enumerate(results, 1):
+        lines.append("{:<4} {:<9} {:.4f} {:8.4f} {:9.4f} {:<10} {:<12} {}-{}   {}".format(
+            i, time_rank[id(r)], r['score'], r['train_time'], r['predict_time'], r['clf'],
+            r['max_features'], r['ngram_range'][0], r['ngram_range'][1], "on" if r['stemming'] else "off"))
+    return "\n".join(lines)
@@ -0,0 +1,112 @@
+# coding=utf-8
+import threading
+import unittest
+
+from datasource import BrowserPool
+
+
+class StubBrowser(object):
+    """
+    Przeglądarka testowa - zapamiętuje tylko, czy została zamknięta.
+    """
+
+    def __init__(self):
+        self.closed = False
+
+    def quit(self):
+        self.closed = True
+
+
+class BrowserPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.browsers = []
+
+    def factory(self):
+        browser = StubBrowser()
+        self.browsers.append(browser)
+        return browser
+
+    def acquire_in_thread(self, pool):
+        """
+        Pobiera przeglądarkę z puli w osobnym wątku.
+
+        :returns: wątek, lista, do której trafi pobrana przeglądarka
+        """
+        acquired = []
+        thread = threading.Thread(target=lambda: acquired.append(pool.acquire()))
+        thread.daemon = True
+        thread.start()
+        return thread, acquired
+
+    def test_reuses_released_browser(self):
+        pool = BrowserPool(size=2, factory=self.factory)
+        with pool.browser() as browser:
+            pass
+        with pool.browser() as again:
+            self.assertIs(again, browser)
+        self.assertEqual(len(self.browsers), 1)
+
+    def test_replaces_broken_and_worn_out_browsers(self):
+        pool = BrowserPool(size=1, max_pages=2, factory=self.factory)
+        with self.assertRaises(ValueError):
+            with pool.browser():
+                raise ValueError()
+        self.assertTrue(self.browsers[0].closed)
+        for i in xrange(2):
+            with pool.browser():
+                pass
+        self.assertTrue(self.browsers[1].closed)
+        self.assertEqual(pool.created, 0)
+
+    def test_exhausted_pool_blocks_until_release(self):
+        pool = BrowserPool(size=1, factory=self.factory)
+        browser = pool.acquire()
+        thread, acquired = self.acquire_in_thread(pool)
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        pool.release(browser)
+        thread.join(5)
+        self.assertEqual(acquired, [browser])
+
+    def test_exhausted_pool_blocks_until_discard(self):
+        pool = BrowserPool(size=1, factory=self.factory)
+        browser = pool.acquire()
+        thread, acquired = self.acquire_in_thread(pool)
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        pool.discard(browser)
+        thread.join(5)
+        self.assertEqual(len(acquired), 1)
+        self.assertIsNot(acquired[0], browser)
+        self.assertTrue(browser.closed)
+
+    def test_resize_wakes_waiting_thread(self):
+        pool = BrowserPool(size=1, factory=self.factory)
+        pool.acquire()
+        thread, acquired = self.acquire_in_thread(pool)
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+        pool.resize(2)
+        thread.join(5)
+        self.assertEqual(len(acquired), 1)
+        self.assertEqual(pool.created, 2)
+
+    def test_resize_does_not_shrink(self):
+        pool = BrowserPool(size=3, factory=self.factory)
+        pool.resize(1)
+        self.assertEqual(pool.size, 3)
+
+    def test_warm_and_close(self):
+        pool = BrowserPool(size=3, factory=self.factory)
+        pool.warm()
+        self.assertEqual(len(self.browsers), 3)
+        self.assertEqual(len(pool.idle), 3)
+        pool.close()
+        self.assertTrue(all(browser.closed for browser in self.browsers))
+        self.assertEqual(pool.idle, [])
+        self.assertEqual(pool.created, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
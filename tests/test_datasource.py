@@ -0,0 +1,122 @@
+# coding=utf-8
+import BaseHTTPServer
+import random
+import threading
+import unittest
+
+from selenium.common.exceptions import TimeoutException
+
+import datasource
+from tests.workspace import Workspace
+
+PAGE = "<html><body><p>strona testowa</p></body></html>"
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """
+    Serwer testowy - liczy żądania, nagłówki ETag/Last-Modified ustawia test.
+    """
+    requests = []
+    headers_to_send = {}
+
+    def send_page(self, body):
+        Handler.requests.append(self.command)
+        if self.headers.get('If-None-Match') and self.headers.get('If-None-Match') == self.headers_to_send.get('ETag'):
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html')
+        self.send_header('Content-Length', str(len(PAGE)))
+        for name, value in self.headers_to_send.iteritems():
+            self.send_header(name, value)
+        self.end_headers()
+        if body:
+            self.wfile.write(PAGE)
+
+    def do_GET(self):
+        self.send_page(True)
+
+    def do_HEAD(self):
+        self.send_page(False)
+
+    def log_message(self, *args):
+        pass
+
+
+class GetWebsiteTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), Handler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+        cls.url = "http://127.0.0.1:{}/".format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        Handler.requests = []
+        Handler.headers_to_send = {'ETag': '"v1"'}
+        self.fetch_website_js = datasource.fetch_website_js
+        self.workspace = Workspace(pages_per_category=0).__enter__()
+
+    def tearDown(self):
+        self.workspace.__exit__(None, None, None)
+        datasource.fetch_website_js = self.fetch_website_js
+
+    def use_browser(self, enabled):
+        """
+        Podmienia pobieranie przeglądarką - zwraca stronę bez żądania albo zgłasza timeout (pobieranie html).
+        """
+        def fetch_website_js(url):
+            if not enabled:
+                raise TimeoutException()
+            return PAGE.decode('utf-8')
+        datasource.fetch_website_js = fetch_website_js
+
+    def test_html_fetch_uses_response_headers(self):
+        self.use_browser(False)
+        datasource.get_website(self.url)
+        self.assertEqual(Handler.requests, ['GET'])
+        self.assertEqual(datasource.read_meta(self.url)['etag'], '"v1"')
+        datasource.get_website(self.url, force=True)
+        self.assertEqual(Handler.requests, ['GET', 'HEAD'])
+
+    def test_browser_fetch_requests_headers_once(self):
+        self.use_browser(True)
+        datasource.get_website(self.url)
+        self.assertEqual(Handler.requests, ['HEAD'])
+        self.assertEqual(datasource.read_meta(self.url)['etag'], '"v1"')
+
+    def test_missing_headers_are_recorded(self):
+        Handler.headers_to_send = {}
+        self.use_browser(True)
+        datasource.get_website(self.url)
+        self.assertEqual(Handler.requests, ['HEAD'])
+        meta = datasource.read_meta(self.url)
+        self.assertIsNone(meta['etag'])
+        self.assertIsNone(meta['last_modified'])
+        datasource.get_website(self.url, force=True)
+        datasource.get_website(self.url, force=True)
+        self.assertEqual(Handler.requests, ['HEAD'])
+
+
+class IterShuffledTest(unittest.TestCase):
+
+    def test_small_buffer_keeps_order(self):
+        for buffer_size in (0, 1):
+            self.assertEqual(list(datasource.iter_shuffled(xrange(10), buffer_size)), range(10))
+
+    def test_shuffle_is_permutation(self):
+        items = list(datasource.iter_shuffled(xrange(100), 10, random.Random(1)))
+        self.assertEqual(sorted(items), range(100))
+        self.assertNotEqual(items, range(100))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.sparse
+
+import datasource
+from featurecache import FeatureCache
+from tests.workspace import Workspace
+
+
+class FeatureCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_evicts_least_recently_used(self):
+        matrix = scipy.sparse.csr_matrix(np.arange(100).reshape(10, 10))
+        cache = FeatureCache(self.directory)
+        cache.put("a", matrix)
+        entry_size = os.path.getsize(cache.get_path("a"))
+        cache.max_size = 2 * entry_size
+        cache.put("b", matrix)
+        os.utime(cache.get_path("a"), (0, 0))
+        os.utime(cache.get_path("b"), (1, 1))
+        cache.get("a")
+        cache.put("c", matrix)
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+
+class PageVersionTest(unittest.TestCase):
+
+    def test_version_follows_page_content(self):
+        with Workspace(pages_per_category=1):
+            version = datasource.get_page_version("info0.pl")
+            self.assertEqual(version, datasource.get_page_version("info0.pl"))
+            datasource.save_website("info0.pl", "<html><body>inna treść</body></html>")
+            self.assertNotEqual(version, datasource.get_page_version("info0.pl"))
+            self.assertIsNone(datasource.get_page_version("missing.pl"))
+
+
+if __name__ == '__main__':
+    unittest.main()
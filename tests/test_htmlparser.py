@@ -0,0 +1,37 @@
+# coding=utf-8
+import random
+import sys
+import unittest
+
+import htmlparser
+
+
+def break_on_upper_per_char(text):
+    """
+    Dawna implementacja break_on_upper - space_before_upper dla każdego znaku tekstu.
+    """
+    return "".join(htmlparser.space_before_upper(c, htmlparser.char_before(text, i)) for i, c in enumerate(text))
+
+
+class BreakOnUpperTest(unittest.TestCase):
+
+    def test_ranges_match_isupper(self):
+        upper = set(i for first, last in htmlparser.UPPER_RANGES for i in xrange(first, last + 1))
+        expected = set(i for i in xrange(sys.maxunicode + 1) if unichr(i).isupper())
+        self.assertEqual(upper, expected)
+
+    def test_matches_per_char_implementation(self):
+        rnd = random.Random(7)
+        upper = [unichr(i) for first, last in htmlparser.UPPER_RANGES for i in xrange(first, last + 1)
+                 if i <= sys.maxunicode]
+        alphabet = upper[:200] + rnd.sample(upper, 200) + list(u"abcząęłóśżź \n\t\"'.,-1ĄŻÓ")
+        texts = [u"", u"A", u"aB", u"AB", u" B", u"\"B", u"'B", u"WiadomościSport TVN24 \"Kraj\""]
+        texts += [u"".join(rnd.choice(alphabet) for j in xrange(50)) for i in xrange(200)]
+        for text in texts:
+            self.assertEqual(htmlparser.break_on_upper(text), break_on_upper_per_char(text))
+        for text in ["", "aB", "AB", "MeczLiga 'Tak' \"Nie\""]:
+            self.assertEqual(htmlparser.break_on_upper(text), break_on_upper_per_char(text))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# coding=utf-8
+import os
+import unittest
+
+import classifier
+import datasource
+import inference
+from tests.workspace import Workspace
+
+
+class SaveInferenceModelTest(unittest.TestCase):
+    """
+    Zapisywanie wersji zwartego modelu (inference.save_inference_model).
+    """
+
+    def setUp(self):
+        self.workspace = Workspace().__enter__()
+        self.cl = classifier.get_trained_classifier(datasource.get_raw_entries("websites.txt"), 1)
+
+    def tearDown(self):
+        self.workspace.__exit__()
+
+    def test_replaced_versions_are_kept_for_grace_period(self):
+        versions = [inference.save_inference_model(self.cl, "model") for i in xrange(3)]
+        self.assertEqual(sorted(os.listdir("model")), sorted(versions + ["current.json"]))
+        model = inference.load_inference_model(os.path.join("model", "current.json"))
+        self.assertEqual(model.version, versions[-1])
+
+    def test_expired_versions_are_removed(self):
+        grace = inference.VERSION_GRACE
+        inference.VERSION_GRACE = -1
+        try:
+            versions = [inference.save_inference_model(self.cl, "model") for i in xrange(3)]
+        finally:
+            inference.VERSION_GRACE = grace
+        self.assertEqual(sorted(os.listdir("model")), sorted([versions[-1], "current.json"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
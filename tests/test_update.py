@@ -0,0 +1,89 @@
+# coding=utf-8
+import os
+import unittest
+
+import htmlparser
+import main
+from tests.workspace import Workspace
+
+
+class UpdateWebsiteTest(unittest.TestCase):
+    """
+    Douczanie klasyfikatora poprawkami (main.update_website).
+    """
+
+    def setUp(self):
+        self.workspace = Workspace().__enter__()
+        main.registry.clear()
+        self.picklename = main.get_classifier_picklename("websites.txt", 1)
+        main.get_classifier()
+
+    def tearDown(self):
+        main.registry.clear()
+        self.workspace.__exit__()
+
+    def test_update_from_another_process(self):
+        self.workspace.add_page("other.pl", "sport", seed=1)
+        self.workspace.add_page("local.pl", "tech", seed=2)
+        stale = main.registry.get(self.picklename)
+
+        pid = os.fork()
+        if pid == 0:
+            # proces potomny ma w rejestrze ten sam klasyfikator co rodzic
+            status = 1
+            try:
+                main.update_website("other.pl", "sport")
+                status = 0
+            finally:
+                os._exit(status)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+        self.assertIsNot(main.registry.get(self.picklename), stale)
+        main.update_website("local.pl", "tech")
+        for cl in (main.registry.get(self.picklename), main.read_classifier(self.picklename)):
+            self.assertEqual(cl.texts_categories_urls["other.pl"][1], "sport")
+            self.assertEqual(cl.texts_categories_urls["local.pl"][1], "tech")
+        self.assertEqual([e['url'] for e in main.read_updates(self.picklename)], ["other.pl", "local.pl"])
+
+    def test_update_does_not_modify_served_classifier(self):
+        self.workspace.add_page("new.pl", "info", seed=3)
+        served = main.registry.get(self.picklename)
+        coef = served.clf.coef_.copy()
+        mtime = os.path.getmtime(self.picklename)
+
+        main.update_website("new.pl", "info")
+
+        self.assertIsNot(main.registry.get(self.picklename), served)
+        self.assertTrue((served.clf.coef_ == coef).all())
+        self.assertEqual(os.path.getmtime(self.picklename), mtime)
+
+    def test_replay_uses_journal_text(self):
+        self.workspace.add_page("new.pl", "info", seed=3)
+        main.update_website("new.pl", "info")
+
+        def fail(*args, **kwargs):
+            raise AssertionError("page text extracted during replay")
+        get_filtered_text = htmlparser.get_filtered_text
+        htmlparser.get_filtered_text = fail
+        try:
+            cl = main.read_classifier(self.picklename)
+        finally:
+            htmlparser.get_filtered_text = get_filtered_text
+        self.assertEqual(cl.texts_categories_urls["new.pl"][1], "info")
+
+    def test_checkpoint_clears_journal(self):
+        interval = main.CHECKPOINT_INTERVAL
+        main.CHECKPOINT_INTERVAL = 2
+        try:
+            for i in xrange(2):
+                self.workspace.add_page("new{}.pl".format(i), "sport", seed=i)
+                main.update_website("new{}.pl".format(i), "sport")
+        finally:
+            main.CHECKPOINT_INTERVAL = interval
+        self.assertEqual(main.read_updates(self.picklename), [])
+        cl = main.read_classifier(self.picklename)
+        self.assertIn("new1.pl", cl.texts_categories_urls)
+
+
+if __name__ == '__main__':
+    unittest.main()
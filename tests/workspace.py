@@ -0,0 +1,74 @@
+# coding=utf-8
+import os
+import random
+import shutil
+import tempfile
+
+import datasource
+
+# słowa charakterystyczne dla kategorii stron testowych
+WORDS = {
+    'sport': u"mecz bramka piłkarz trener liga stadion kibice drużyna turniej wynik".split(),
+    'tech': u"komputer laptop procesor smartfon aplikacja grafika sprzęt recenzja karta system".split(),
+    'info': u"wiadomości polityka rząd wybory minister sejm prezydent kraj świat gospodarka".split(),
+}
+COMMON = u"strona główna kontakt regulamin zaloguj szukaj menu".split()
+
+
+def get_page(category, rnd):
+    """
+    Tworzy kod strony testowej z tekstem złożonym ze słów kategorii i słów wspólnych.
+
+    :param category: kategoria strony
+    :param rnd: generator liczb losowych
+    :returns: html
+    """
+    words = [rnd.choice(WORDS[category] + COMMON) for i in xrange(200)]
+    html = u"<html><head><title>{}</title></head><body><p>{}</p></body></html>".format(category, u" ".join(words))
+    return html.encode('utf-8')
+
+
+class Workspace(object):
+    """
+    Tymczasowy katalog roboczy z zapisanymi stronami i plikiem wpisów - klasyfikator uczy się bez sieci.
+    """
+
+    def __init__(self, pages_per_category=6, filename="websites.txt"):
+        """
+        Konstruktor.
+
+        :param pages_per_category: liczba stron w każdej kategorii
+        :param filename: nazwa pliku z wpisami
+        """
+        self.pages_per_category = pages_per_category
+        self.filename = filename
+        self.directory = None
+        self.cwd = None
+
+    def __enter__(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp()
+        os.chdir(self.directory)
+        rnd = random.Random(123)
+        with open(self.filename, 'w') as f:
+            f.write("url|category\n")
+            for category in sorted(WORDS):
+                for i in xrange(self.pages_per_category):
+                    url = "{}{}.pl".format(category, i)
+                    datasource.save_website(url, get_page(category, rnd))
+                    f.write("{}|{}\n".format(url, category))
+        return self
+
+    def __exit__(self, *exc_info):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def add_page(self, url, category, seed=0):
+        """
+        Zapisuje dodatkową stronę (np. do douczania).
+
+        :param url: adres strony
+        :param category: kategoria, ze słów której składa się strona
+        :param seed: ziarno generatora słów
+        """
+        datasource.save_website(url, get_page(category, random.Random(seed)))
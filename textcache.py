@@ -0,0 +1,151 @@
+# coding=utf-8
+import hashlib
+import os
+import threading
+
+
+class TextCache(object):
+    """
+    Dyskowa pamięć podręczna przetworzonych tekstów stron.
+
+    Kluczem jest skrót kodu strony i parametrów przetwarzania, więc zmiana strony lub sposobu
+    przetwarzania automatycznie unieważnia wpis. Po przekroczeniu maksymalnego rozmiaru
+    usuwane są najdawniej używane wpisy.
+    """
+
+    def __init__(self, directory="cache/text/", max_size=256 * 1024 * 1024):
+        """
+        Konstruktor.
+
+        :param directory: katalog z zapisanymi tekstami
+        :param max_size: maksymalny łączny rozmiar plików w bajtach
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self.size = None
+        self.lock = threading.Lock()
+
+    def key(self, html, *params):
+        """
+        Zwraca klucz wpisu.
+
+        :param html: kod strony
+        :param params: parametry przetwarzania, np. wersja potoku
+        :returns: skrót sha1
+        """
+        h = hashlib.sha1(html)
+        for param in params:
+            h.update("|" + str(param))
+        return h.hexdigest()
+
+    def get_path(self, key):
+        """
+        Zwraca ścieżkę do pliku wpisu.
+
+        :param key: klucz wpisu
+        :returns: ścieżka
+        """
+        return os.path.join(self.directory, key[:2], key + ".txt")
+
+    def get(self, key):
+        """
+        Odczytuje tekst z pamięci podręcznej.
+
+        :param key: klucz wpisu
+        :returns: tekst lub None jeśli nie ma wpisu
+        """
+        path = self.get_path(key)
+        try:
+            with open(path, 'rb') as f:
+                text = f.read()
+        except IOError:
+            return None
+        try:
+            # czas modyfikacji służy jako czas ostatniego użycia
+            os.utime(path, None)
+        except OSError:
+            pass
+        return text.decode('utf-8')
+
+    def put(self, key, text):
+        """
+        Zapisuje tekst w pamięci podręcznej.
+
+        :param key: klucz wpisu
+        :param text: tekst
+        """
+        path = self.get_path(key)
+        data = text.encode('utf-8')
+        if not os.path.exists(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError:
+                pass
+        tmpname = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmpname, 'wb') as f:
+            f.write(data)
+        os.rename(tmpname, path)
+
+        with self.lock:
+            if self.size is None:
+                self.size = self.get_size()
+            else:
+                self.size += len(data)
+            if self.size > self.max_size:
+                self.evict()
+
+    def get_files(self):
+        """
+        Zwraca listę plików wpisów.
+
+        :returns: lista krotek (czas ostatniego użycia, rozmiar, ścieżka)
+        """
+        files = []
+        if not os.path.exists(self.directory):
+            return files
+        for root, dirs, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        return files
+
+    def get_size(self):
+        """
+        Zwraca łączny rozmiar plików wpisów.
+
+        :returns: rozmiar w bajtach
+        """
+        return sum(size for mtime, size, path in self.get_files())
+
+    def evict(self):
+        """
+        Usuwa najdawniej używane wpisy, aż rozmiar spadnie do 90% maksymalnego.
+        """
+        files = sorted(self.get_files())
+        size = sum(size for mtime, size, path in files)
+        limit = self.max_size * 0.9
+        for mtime, file_size, path in files:
+            if size <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= file_size
+        self.size = size
+
+    def clear(self):
+        """
+        Usuwa wszystkie wpisy.
+        """
+        with self.lock:
+            for mtime, size, path in self.get_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.size = 0